@@ -2,18 +2,30 @@
 
 PRACNUMBER = 4
 
+import argparse
+import functools
 import importlib
 import os
 import logging
 import time
 import csv
+import multiprocessing
+import queue
 #import group_manager
 import individual_manager
-from prac_tests import BuildFailedError, SourceFileProblem
+from prac_tests import BuildFailedError, SourceFileProblem, RigFailedError
+from rig import Rig
+import results_cache
+from journal import Journal
 
 tester_module = importlib.import_module("prac_exam_2_part_{n}_tests".format(n = PRACNUMBER))
 TesterClass = getattr(tester_module, "PracExam2Part{n}Tests".format(n = PRACNUMBER))
 
+parser = argparse.ArgumentParser(description = "Builds and tests every submitter listed in grades.csv")
+parser.add_argument("--resume", action = "store_true",
+        help = "carry on from the journal of an earlier run which didn't finish, rather than starting again")
+args = parser.parse_args()
+
 logger = logging.getLogger()
 logfile_handler = logging.FileHandler(filename = "/tmp/prac_exam_2_part_{p}_{t}.log".format(
     p = PRACNUMBER, t = time.strftime("%Y_%m_%d_%H_%M_%S", time.localtime())))
@@ -26,39 +38,294 @@ console_handler.setLevel(logging.DEBUG)
 console_handler.setFormatter(logging.Formatter("%(asctime)s:" + logging.BASIC_FORMAT))
 logger.addHandler(console_handler)
 
+# One worker process is started per rig and submitters are handed to whichever rig is free.
+# Each rig needs its own interrogator, ST-Link and set of OpenOCD ports.
+RIGS = [Rig("rig0", "/dev/ttyUSB0"),
+        #Rig("rig1", "/dev/ttyUSB1", stlink_serial = "...", gdb_port = 3334, tcl_port = 6667, telnet_port = 4445),
+        #Rig("rig2", "/dev/ttyUSB2", stlink_serial = "...", gdb_port = 3335, tcl_port = 6668, telnet_port = 4446),
+        #Rig("rig3", "/dev/ttyUSB3", stlink_serial = "...", gdb_port = 3336, tcl_port = 6669, telnet_port = 4447),
+       ]
+
+# Submitters are unzipped and built by a pool of build processes while the rigs test earlier submitters.
+# At most BUILD_AHEAD submitters are being built or waiting for a rig at any one time.
+# Each one is built in its own directory under BUILD_ROOT, which is removed once the submitter is done
+# with: after testing, or straight after the build if there is nothing to test.
+# BUILD_ROOT is on tmpfs so the builds don't wait on the disk, and needs to be writable by marker.
+BUILD_WORKERS = 4
+BUILD_AHEAD = 8
+BUILD_ROOT = "/dev/shm/marker_builds/"
+
 BASE_DIR = "/tmp/Practical Exam 2 Part {p}/".format(p = PRACNUMBER)
-COMMON_DIR = "/tmp/prac_exam_2_part{n}_common_dir_{t}".format(n = PRACNUMBER, t = time.strftime("%Y_%m_%d_%H_%M_%S"))
-os.mkdir(COMMON_DIR)
+
+# Marks from earlier runs are reused for submitters whose built files, submission details (such as
+# the submission time), test code and rig calibration are all unchanged. Bump RIG_CALIBRATION whenever
+# the rigs are recalibrated, so everyone is re-tested.
+# Set USE_RESULTS_CACHE to False (or delete the cache file) to re-test everyone regardless.
+USE_RESULTS_CACHE = True
+RIG_CALIBRATION = 1
+RESULTS_CACHE = BASE_DIR + "results_cache.json"
+results = results_cache.ResultsCache(RESULTS_CACHE)
+TESTS_HASH = results_cache.hash_test_sources(TesterClass)
+# Every finished submitter is journaled as it comes back from the rigs. If the automarker dies,
+# run it again with --resume to skip everyone in the journal and mark only the rest.
+JOURNAL = BASE_DIR + "journal.jsonl"
+journal = Journal(JOURNAL, args.resume, common_dir = "/tmp/prac_exam_2_part{n}_common_dir_{t}".format(
+    n = PRACNUMBER, t = time.strftime("%Y_%m_%d_%H_%M_%S")))
+# a resumed run carries on filling the common directory of the run it resumes
+COMMON_DIR = journal.run_info['common_dir']
+os.makedirs(COMMON_DIR, exist_ok = True)
 logger.info("Automarker beginning execution")
+if journal.completed:
+    logger.info("Resuming: {n} submitters already marked according to {j}".format(n = len(journal.completed), j = JOURNAL))
 
-indivman = individual_manager.IndividualManager(BASE_DIR)
-for submitter in indivman:
-    submitter.find_directories(BASE_DIR)
-    logfile_handler.setFormatter(logging.Formatter("%(asctime)s:" + submitter.members + ':' + logging.BASIC_FORMAT))
-    console_handler.setFormatter(logging.Formatter("%(asctime)s:" + submitter.members + ':' + logging.BASIC_FORMAT))
-    logger.info("====Starting to deal with submitter: {s}====".format(s = submitter.members))
-    comment_logger = logging.FileHandler("{d}/comments.txt".format(d = submitter.directory), 'w')
+def start_submitter_logging(stage, submitter, mode):
+    prefix = "%(asctime)s:" + stage + ':' + submitter.members + ':'
+    logfile_handler.setFormatter(logging.Formatter(prefix + logging.BASIC_FORMAT))
+    console_handler.setFormatter(logging.Formatter(prefix + logging.BASIC_FORMAT))
+    comment_logger = logging.FileHandler("{d}/comments.txt".format(d = submitter.directory), mode)
     comment_logger.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s<br>'))
     comment_logger.setLevel(logging.INFO)
     logger.addHandler(comment_logger)
+    return comment_logger
+
+def stop_submitter_logging(comment_logger):
+    comment_logger.close()
+    logger.removeHandler(comment_logger)
+    logger.debug("Closed and removed comment_logger handler")
+
+def build_submitter(submitter):
+    """ Runs in the build pool. Leaves submitter.elf_file as None if there is nothing to test.
+    """
+    submitter.elf_file = None
+    submitter.outcome = "not built"
+    submitter.budget_exhausted = False
+    submitter.results_key = None
+    submitter.cached_result = None
+    submitter.directory = None
+    comment_logger = None
+    tester = None
+    workspace_created = False
     try:
-        tester =  TesterClass(submitter, logger.getChild('part{n}'.format(n = PRACNUMBER)))
+        submitter.find_directories(BASE_DIR)
+        comment_logger = start_submitter_logging("build", submitter, 'w')
+        logger.info("====Starting to deal with submitter: {s}====".format(s = submitter.members))
+        tester = TesterClass(submitter, logger.getChild('part{n}'.format(n = PRACNUMBER)))
         tester.unzip_submission()
         tester.catalogue_submission_files()
         submitter.copy_files_to_common_dir(COMMON_DIR)
+        workspace_created = True # set first, as a half made workspace needs removing too
+        tester.create_workspace(BUILD_ROOT + submitter.user_id + '/')
         tester.build()
-        tester.run_tests()
+        submitter.workspace = tester.workspace
+        submitter.elf_file = os.path.join(tester.workspace, tester.elf_file)
+        submission_hash = results_cache.hash_files(tester.workspace, submitter.files_to_mark)
+        metadata_hash = results_cache.hash_submitter_metadata(submitter)
+        submitter.results_key = results_cache.results_key(submission_hash, metadata_hash, TESTS_HASH, RIG_CALIBRATION)
+        if USE_RESULTS_CACHE:
+            submitter.cached_result = results.lookup(submitter.user_id, submitter.results_key)
+        if submitter.cached_result is not None:
+            logger.info("Submission and tests unchanged since it was last marked, so reusing that mark")
     except SourceFileProblem as e:
         logger.critical("Problem with source files. Exiting")
     except BuildFailedError as e:
         logger.critical("Build Failed. Exiting")
+    except Exception as e:
+        # a crash here must not hold up the rigs, so the submitter goes back without being tested
+        logger.exception(e)
+        logger.critical("Build aborted by an unexpected error")
+        submitter.outcome = "aborted"
+    finally:
+        # only a submitter going on to the rigs still needs its workspace
+        if workspace_created and (submitter.elf_file is None or submitter.cached_result is not None):
+            remove_workspace(tester)
+        if comment_logger is not None:
+            stop_submitter_logging(comment_logger)
+    return submitter
+
+def remove_workspace(tester):
+    try:
+        tester.remove_workspace()
+    except BuildFailedError:
+        logger.warning("Could not remove workspace {w}".format(w = tester.workspace))
+
+def submitter_result(submitter, comments = None):
+    # the submitter object lives in a worker, so this is what gets handed back to the parent
+    return {'user_id': submitter.user_id, 'outcome': submitter.outcome, 'directory': submitter.directory,
+            'mark': submitter.mark, 'budget_exhausted': submitter.budget_exhausted,
+            'results_key': submitter.results_key, 'comments': comments}
+
+def rig_worker(rig, ready_queue, ready_slots, results_queue):
+    """ Runs in one process per rig, testing built submitters until it receives None
+    or the rig fails.
+    """
+    logger.info("Worker {pid} running on {r}".format(pid = os.getpid(), r = rig))
+    try:
+        test_submitters(rig, ready_queue, ready_slots, results_queue)
     finally:
-        comment_logger.close()
-        logger.removeHandler(comment_logger)
-        logger.debug("Closed and removed comment_logger handler")
+        rig.close()
+
+def test_submitters(rig, ready_queue, ready_slots, results_queue):
+    for submitter in iter(ready_queue.get, None):
+        ready_slots.release() # let the build pool start on the next submitter
+        comments = None
+        if submitter.elf_file is not None:
+            comment_logger = start_submitter_logging(rig.name, submitter, 'a')
+            tester = None
+            try:
+                tester = TesterClass(submitter, logger.getChild('part{n}'.format(n = PRACNUMBER)), rig)
+                tester.workspace = submitter.workspace
+                tester.elf_file = submitter.elf_file
+                tester.run_tests()
+                submitter.outcome = "tested"
+            except RigFailedError as e:
+                logger.exception(e)
+                submitter.outcome = "rig failed"
+            except Exception as e:
+                logger.exception(e)
+                logger.critical("Marking aborted by an unexpected error")
+                submitter.outcome = "aborted"
+                submitter.results_key = None # so the incomplete result isn't reused next time
+            finally:
+                # a submitter handed on after a rig failure is built once only, so keeps its workspace
+                if tester is not None and submitter.outcome != "rig failed":
+                    remove_workspace(tester)
+                stop_submitter_logging(comment_logger)
+            if submitter.outcome == "rig failed":
+                # nothing was tested, so no mark. Another rig picks the submitter up from the queue, and its
+                # slot isn't taken back, as that could wait forever with no rig left to free one
+                ready_queue.put(submitter)
+                results_queue.put(submitter_result(submitter))
+                return
+            with open("{d}/comments.txt".format(d = submitter.directory)) as f:
+                comments = f.read()
+        results_queue.put(submitter_result(submitter, comments))
+
+def submitter_built(submitter):
+    """ Called in the parent as each build finishes. Submitters with a reusable earlier result skip the rigs.
+    """
+    if submitter.cached_result is None:
+        ready_queue.put(submitter)
+        return
+    ready_slots.release()
+    with open("{d}/comments.txt".format(d = submitter.directory), 'w') as f:
+        f.write(submitter.cached_result['comments'])
+    submitter.outcome = "cached"
+    submitter.mark = submitter.cached_result['mark']
+    submitter.results_key = None
+    results_queue.put(submitter_result(submitter))
+
+def build_crashed(submitter, error):
+    """ Called in the parent if a build raised anyway, say when returning the submitter. Nothing else
+    would give back its slot or its result, so the parent would wait for it forever.
+    """
+    logger.critical("Building {u} failed: {e!r}".format(u = submitter.user_id, e = error))
+    ready_slots.release()
+    submitter.outcome = "aborted"
+    submitter.directory = None
+    submitter.budget_exhausted = False
+    submitter.results_key = None
+    results_queue.put(submitter_result(submitter))
+
+def rigs_working():
+    return any(w.is_alive() for w in rig_workers)
+
+def acquire_build_slot():
+    """ Blocks while BUILD_AHEAD submitters are already built or building, recording results as they
+    come back meanwhile. Returns False if every rig has failed, as then no slot will come free.
+    """
+    drain_results()
+    while not ready_slots.acquire(timeout = 1):
+        drain_results()
+        if not rigs_working():
+            return False
+    return True
+
+def drain_results():
+    """ Records every result already waiting, without blocking
+    """
+    while True:
+        try:
+            record_result(results_queue.get_nowait())
+        except queue.Empty:
+            return
+
+def record_result(result):
+    """ Journals a result as soon as it is back, so a crash later on loses none of the marks so far
+    """
+    if result['outcome'] == "rig failed":
+        logger.critical("A rig failed while getting ready to test {u}, who has gone back in the queue".format(u = result['user_id']))
+        return
+    user_id, directory, mark = result['user_id'], result['directory'], result['mark']
+    budget_exhausted, results_key, comments = result['budget_exhausted'], result['results_key'], result['comments']
+    pending.discard(user_id)
+    marks[user_id] = mark
+    if result['outcome'] == "aborted":
+        # the mark is only as far as testing got, so this submitter is left out of the journal
+        # and a resumed run tests them again
+        aborted.append(user_id)
+    else:
+        journal.record(user_id, mark, outcome = result['outcome'], budget_exhausted = budget_exhausted,
+                comments = "{d}/comments.txt".format(d = directory),
+                common_dir = "{c}/{m}".format(c = COMMON_DIR, m = user_id))
+    if budget_exhausted:
+        out_of_time.append(user_id)
+    elif results_key is not None:
+        results.record(user_id, results_key, mark, comments)
+    logger.info("Received mark of {m:g} for {u}. {n} of {t} done".format(
+        m = mark, u = user_id, n = len(indivman.individuals) - len(pending), t = len(indivman.individuals)))
+
+indivman = individual_manager.IndividualManager(BASE_DIR)
+# fork so that the workers inherit the logging set up above rather than re-running this script
+ctx = multiprocessing.get_context("fork")
+ready_queue = ctx.Queue()
+ready_slots = ctx.BoundedSemaphore(BUILD_AHEAD)
+results_queue = ctx.Queue()
+rig_workers = [ctx.Process(target = rig_worker, args = (r, ready_queue, ready_slots, results_queue)) for r in RIGS]
+for w in rig_workers:
+    w.start()
+marks = {user_id: entry['mark'] for user_id, entry in journal.completed.items()}
+out_of_time = [user_id for user_id, entry in journal.completed.items() if entry['budget_exhausted']]
+aborted = []
+# looked up by user_id, as the journal may also hold submitters no longer in grades.csv
+pending = set(submitter.user_id for submitter in indivman.individuals) - set(journal.completed)
+with ctx.Pool(BUILD_WORKERS) as build_pool:
+    for submitter in indivman.individuals:
+        if submitter.user_id not in pending:
+            continue
+        if not acquire_build_slot():
+            break
+        build_pool.apply_async(build_submitter, (submitter,), callback = submitter_built,
+                error_callback = functools.partial(build_crashed, submitter))
+    while pending:
+        try:
+            result = results_queue.get(timeout = 10)
+        except queue.Empty:
+            if rigs_working():
+                continue
+            logger.critical("Every rig has failed, so stopping with {n} submitters unmarked".format(n = len(pending)))
+            # the submitters waiting for a rig will never be taken, so don't wait to flush them at exit
+            ready_queue.cancel_join_thread()
+            break
+        record_result(result)
+for w in rig_workers:
+    ready_queue.put(None)
+for w in rig_workers:
+    w.join()
 
 logfile_handler.setFormatter(logging.Formatter("%(asctime)s:" + logging.BASIC_FORMAT))
 console_handler.setFormatter(logging.Formatter("%(asctime)s:" + logging.BASIC_FORMAT))
-logger.info("Generating marks file")
-indivman.generate_marks_file("{b}/grades.csv".format(b = BASE_DIR), \
-        "{b}/grades_new.csv".format(b = BASE_DIR))
+if out_of_time:
+    logger.warning("Ran out of time budget, so marked only partly: {u}".format(u = ", ".join(out_of_time)))
+if aborted:
+    logger.warning("Marking was cut short by an error for: {u}. Run again with --resume to test them again".format(u = ", ".join(aborted)))
+unmarked = [submitter.user_id for submitter in indivman.individuals if submitter.user_id not in marks]
+if unmarked:
+    # a marks file with zeros for these would look complete, so there isn't one until they are marked
+    logger.critical("Not generating marks file, as these submitters weren't marked: {u}. Fix the rigs and run again with --resume".format(
+        u = ", ".join(unmarked)))
+else:
+    for submitter in indivman:
+        submitter.mark = marks[submitter.user_id]
+    logger.info("Generating marks file")
+    indivman.generate_marks_file("{b}/grades.csv".format(b = BASE_DIR), \
+            "{b}/grades_new.csv".format(b = BASE_DIR))
@@ -0,0 +1,27 @@
+import time
+
+class BudgetExhausted(Exception):
+    pass
+
+class Budget:
+    """ The wall-clock time one submitter may take on a rig. Blocking GDB and interrogator calls
+    take their timeouts from timeout(), so a submission which hangs runs out of budget instead
+    of running up one full timeout after another.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.time() + seconds
+
+    def remaining(self):
+        return self.deadline - time.time()
+
+    def exhausted(self):
+        return self.remaining() <= 0
+
+    def timeout(self, limit):
+        """ limit, cut down to what is left of the budget. Raises BudgetExhausted if nothing is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise BudgetExhausted("Time budget of {s:g} seconds used up".format(s = self.seconds))
+        return min(limit, remaining)
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from results_cache import hash_files
+
+# .elf files from earlier builds, so that a submission whose files (after copying and patching)
+# have been built before isn't built again. Resubmissions, duplicate zips and re-runs after a
+# change to the test code all hit it. The key covers every file in the workspace, which includes
+# the makefile, along with the build command and the version of the toolchain.
+# Each entry is a directory named by its key holding the one .elf the build produced.
+
+_toolchain_version = None
+
+def toolchain_version():
+    """ The version banner of the compiler and assembler, or None if they can't be run
+    """
+    global _toolchain_version
+    if _toolchain_version is None:
+        try:
+            _toolchain_version = b''.join(subprocess.check_output([tool, "--version"], stderr = subprocess.STDOUT)
+                    for tool in ("arm-none-eabi-gcc", "arm-none-eabi-as"))
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return _toolchain_version
+
+def build_key(workspace, cmd):
+    """ Key for building the files now in workspace with cmd. None if the toolchain can't be identified,
+    in which case nothing should be looked up or stored.
+    """
+    version = toolchain_version()
+    if version is None:
+        return None
+    files = [f for f in os.listdir(workspace) if os.path.isfile(os.path.join(workspace, f))]
+    h = hashlib.sha256(hash_files(workspace, files).encode() + b'\0' + cmd.encode() + b'\0')
+    h.update(hashlib.sha256(version).digest())
+    return h.hexdigest()
+
+def lookup(cache_dir, key):
+    """ Path of the cached .elf for key, or None
+    """
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry):
+        return None
+    elf_files = [f for f in os.listdir(entry) if f.endswith(".elf")]
+    if len(elf_files) != 1:
+        return None
+    return os.path.join(entry, elf_files[0])
+
+def store(cache_dir, key, elf_path):
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+    # filled in to the side and renamed, so other build processes never see half an entry
+    tmp_entry = "{e}.{pid}.tmp".format(e = entry, pid = os.getpid())
+    os.makedirs(tmp_entry, exist_ok = True)
+    shutil.copyfile(elf_path, os.path.join(tmp_entry, os.path.basename(elf_path)))
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        shutil.rmtree(tmp_entry) # another build process stored the same key first
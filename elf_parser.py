@@ -1,28 +1,78 @@
-import subprocess
+import mmap
+import os
+import struct
+
+# Reads the symbol table and section sizes straight out of the .elf rather than forking
+# arm-none-eabi-objdump and size. Parsed files are cached until they are modified.
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+STT_FUNC = 2
+STT_SECTION = 3
+STT_FILE = 4
+SHN_UNDEF = 0
+
+class ElfFormatError(Exception):
+    pass
+
+class ElfFile:
+    def __init__(self, elf):
+        self.symbols = {} # name -> address
+        self.text_size = 0
+        with open(elf, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                self.parse(m)
+
+    def parse(self, m):
+        if m[0:4] != b'\x7fELF':
+            raise ElfFormatError("Not an ELF file")
+        if m[4] != 1:
+            raise ElfFormatError("Only 32 bit ELF files are supported")
+        endian = '<' if m[5] == 1 else '>'
+        header = struct.unpack_from(endian + "16xHHIIIIIHHHHHH", m, 0)
+        shoff, shentsize, shnum = header[5], header[10], header[11]
+        sections = [struct.unpack_from(endian + "10I", m, shoff + i*shentsize) for i in range(shnum)]
+        for (sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size,
+             sh_link, sh_info, sh_addralign, sh_entsize) in sections:
+            # same rule as the Berkeley format of 'size': allocated, read only and taking space in the file
+            if (sh_flags & SHF_ALLOC) and not (sh_flags & SHF_WRITE) and sh_type != SHT_NOBITS:
+                self.text_size += sh_size
+            if sh_type == SHT_SYMTAB:
+                strtab_offset = sections[sh_link][4]
+                self.parse_symbols(m, endian, sh_offset, sh_size, sh_entsize, strtab_offset)
+
+    def parse_symbols(self, m, endian, offset, size, entsize, strtab_offset):
+        for sym_offset in range(offset, offset + size, entsize):
+            st_name, st_value, st_size, st_info, st_other, st_shndx = \
+                struct.unpack_from(endian + "IIIBBH", m, sym_offset)
+            sym_type = st_info & 0xF
+            if st_name == 0 or st_shndx == SHN_UNDEF or sym_type in (STT_SECTION, STT_FILE):
+                continue
+            name_start = strtab_offset + st_name
+            name = m[name_start:m.find(b'\0', name_start)].decode()
+            if sym_type == STT_FUNC:
+                st_value &= ~1 # drop the thumb bit so the address can be used for breakpoints
+            if name not in self.symbols: # like objdump, the first definition wins
+                self.symbols[name] = st_value
+
+_elf_cache = {} # path -> (mtime, ElfFile)
+
+def load(elf):
+    path = os.path.abspath(elf)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _elf_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, ElfFile(path))
+        _elf_cache[path] = cached
+    return cached[1]
 
 def get_address_of_label(elf, label):
-    objdump = subprocess.Popen(["arm-none-eabi-objdump", "-t", elf], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if objdump.wait() != 0:
-        raise Exception
-    out = objdump.communicate()
-    lines = out[0].splitlines()
-    for line in lines:
-        line = line.decode().strip().split()
-        if (len(line) == 5) and (line[4] == label):
-            address_str = line[0]
-            return int(address_str, 16)
-    raise Exception("Label {} not found in .elf file".format(label))
+    try:
+        return load(elf).symbols[label]
+    except KeyError:
+        raise Exception("Label {} not found in .elf file".format(label))
 
 def get_text_size(elf):
-    objdump = subprocess.Popen(["size", elf], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if objdump.wait() != 0:
-        raise Exception
-    out = objdump.communicate()
-    # will be something like:
-    #   text    data     bss     dec     hex filename
-    #    36        0       0      36      24 main.elf
-    lines = out[0].splitlines()
-    sizes_line = lines[1].split()
-    text_size = sizes_line[0]
-    return int(text_size)
-
+    return load(elf).text_size
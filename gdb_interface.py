@@ -1,6 +1,10 @@
 import pexpect
 import re
+import os
+import array
+import tempfile
 import elf_parser
+from rig import DEFAULT_RIG
 
 class GDBException(Exception):
     pass
@@ -14,24 +18,61 @@ class CodeVerifyFailed(GDBException):
     pass
 class CodeLoadFailed(GDBException):
     pass
+class MemoryReadFailed(GDBException):
+    pass
+class MemoryWriteFailed(GDBException):
+    pass
+
+class BudgetedSpawn(pexpect.spawn):
+    """ A pexpect session whose waits are cut short to fit the current submitter's Budget, if there is one
+    """
+    def __init__(self, *args, **kwargs):
+        self.budget = None
+        super().__init__(*args, **kwargs)
+
+    def budgeted(self, timeout):
+        if timeout == -1:
+            timeout = self.timeout
+        if self.budget is None:
+            return timeout
+        return self.budget.timeout(timeout)
+
+    def expect(self, pattern, timeout = -1, *args, **kwargs):
+        return super().expect(pattern, self.budgeted(timeout), *args, **kwargs)
+
+    def expect_exact(self, pattern_list, timeout = -1, *args, **kwargs):
+        return super().expect_exact(pattern_list, self.budgeted(timeout), *args, **kwargs)
 
 class GDBInterface:
-    def __init__(self, logger):
+    def __init__(self, logger, rig = DEFAULT_RIG):
         self.logger = logger
-        self.logfile = open('/tmp/automarker_gdb.log', 'a')
-        self.gdb = pexpect.spawnu("arm-none-eabi-gdb", timeout=10, logfile=self.logfile)
+        self.rig = rig
+        self.logfile = open('/tmp/automarker_gdb_{r}.log'.format(r = rig.name), 'a')
+        self.gdb = BudgetedSpawn("arm-none-eabi-gdb", timeout=10, logfile=self.logfile, encoding='utf-8')
         self.gdb.expect_exact("(gdb)")
         # disables the "Type <return> to continue, or q <return> to quit"
         self.gdb.sendline("set pagination off")
         self.gdb.expect_exact("(gdb)")
+        # the session is reused, so 'file' must be able to replace the symbols without asking
+        self.gdb.sendline("set confirm off")
+        self.gdb.expect_exact("(gdb)")
+        self.connected = False
+        self.sync_count = 0
         #self.gdb.sendline("set logging file /tmp/automarker_gdb.log")
         #self.gdb.expect_exact("(gdb)")
         #self.gdb.sendline("set logging on")
         #self.gdb.expect_exact("Copying output to")
         #self.gdb.expect_exact("(gdb)")
 
+    @property
+    def budget(self):
+        return self.gdb.budget
+    @budget.setter
+    def budget(self, budget):
+        self.gdb.budget = budget
+
     def terminate(self):
-        self.gdb.terminate()
+        self.gdb.terminate(force=True)
         self.logfile.close()
         self.logger.debug("GDB terminated gracefully")
 
@@ -40,7 +81,41 @@ class GDBInterface:
     def __exit__(self, type, value, traceback):
         self.terminate()
 
+    def sync(self, timeout = 2):
+        """ Stops the target if it is running and waits for a fresh prompt, so that any
+        output left over from the previous submitter has been consumed.
+        """
+        self.gdb.sendcontrol('c')
+        self.sync_count += 1
+        marker = "SYNC_{n}".format(n = self.sync_count)
+        self.gdb.sendline("echo {m}\\n".format(m = marker))
+        self.gdb.expect_exact("{m}\r\n(gdb)".format(m = marker), timeout = timeout)
+
+    def prepare_for_next_submitter(self, reconnect):
+        """ Cleans up after the previous submitter so the session can be reused.
+        reconnect should be True when OpenOCD has been restarted, as the old remote connection is dead.
+        Returns False if GDB is wedged and must be respawned.
+        """
+        try:
+            self.sync()
+            if reconnect and self.connected:
+                self.gdb.sendline("disconnect")
+                self.gdb.expect_exact("(gdb)")
+                self.connected = False
+            self.delete_all_breakpoints()
+            if self.connected:
+                # OpenOCD has just reset the target behind GDB's back
+                self.gdb.sendline("flushregs")
+                self.gdb.expect_exact("(gdb)")
+        except (pexpect.TIMEOUT, pexpect.EOF) as e:
+            self.logger.critical("GDB session not responding. It will be respawned")
+            return False
+        self.logger.debug("GDB session ready for next submitter")
+        return True
+
     def open_file(self, elf_file):
+        # GDB outlives the directory it was started in, so give it the full path
+        elf_file = os.path.abspath(elf_file)
         self.elf_file = elf_file
         self.gdb.sendline("file \"{}\"".format(elf_file))
         # we'll either get a done or a no such file
@@ -50,11 +125,15 @@ class GDBInterface:
             raise Exception("FATAL: Could not open file {} in GDB".format(elf_file))
 
     def connect(self):
-        self.gdb.sendline("target remote localhost:3333")
-        if self.gdb.expect([".*using localhost:3333[\s\S]*\([\s\S]*\)[\s\S]*\(gdb\)", \
+        if self.connected:
+            self.logger.debug("GDB already connected to openOCD")
+            return
+        self.gdb.sendline("target remote localhost:{p}".format(p = self.rig.gdb_port))
+        if self.gdb.expect([".*using localhost:{p}".format(p = self.rig.gdb_port) + "[\s\S]*\([\s\S]*\)[\s\S]*\(gdb\)", \
                 "Remote communication error",\
                 "Connection timed out", "Remote connection closed"]) == 0:
             self.logger.debug("GDB connected to openOCD")
+            self.connected = True
         else:
             raise Exception("FATAL: GDB could not connect to openOCD\r\n")
 
@@ -146,15 +225,48 @@ class GDBInterface:
         self.gdb.expect_exact("(gdb)")
         return int(self.gdb.before.strip(), 16)
 
+    def read_block(self, address, n_words):
+        """ Reads n_words consecutive words starting at address with a single 'x' command.
+        Returns them as an array('I').
+        """
+        self.gdb.sendline("x/{n}wx {a:#x}".format(n = n_words, a = address))
+        self.gdb.expect_exact("(gdb)")
+        # output is lines like: 0x20000000:	0x62967109	0x0674a70b	0x902bff4f	0xe7fa8a65
+        words = array.array('I')
+        for line in self.gdb.before.splitlines():
+            if ':' in line:
+                words.extend(int(w, 16) for w in line.split(':', 1)[1].split())
+        if len(words) != n_words:
+            self.logger.critical("Could only read {r} of {n} words from {a:#x}".format(
+                r = len(words), n = n_words, a = address))
+            raise MemoryReadFailed
+        return words
+
     def write_word(self, address, data):
         set_string = "set {{int}}{a:#x} = {d:#x}".format(a = address, d = data)
         self.gdb.sendline(set_string)
         self.gdb.expect_exact("{}\r\n(gdb)".format(set_string))
     
+    def write_block(self, address, buffer):
+        """ Writes a bytes object, or a sequence of words, to memory starting at address.
+        The data goes through a temporary file and a single 'restore' command, whatever its size.
+        """
+        if not isinstance(buffer, (bytes, bytearray)):
+            buffer = array.array('I', buffer).tobytes()
+        with tempfile.NamedTemporaryFile(prefix = "automarker_", suffix = ".bin") as f:
+            f.write(buffer)
+            f.flush()
+            self.gdb.sendline("restore {f} binary {a:#x}".format(f = f.name, a = address))
+            self.gdb.expect_exact("(gdb)")
+        if "Cannot access memory" in self.gdb.before:
+            self.logger.critical("Could not write {n} bytes to {a:#x}".format(n = len(buffer), a = address))
+            raise MemoryWriteFailed
+
+    def fill(self, address, n_words, value):
+        self.write_block(address, [value & 0xFFFFFFFF] * n_words)
+
     def delete_all_breakpoints(self):
-        self.gdb.sendline("delete")
-        self.gdb.expect_exact("Delete all breakpoints? (y or n) ")
-        self.gdb.sendline("y")
+        self.gdb.sendline("delete") # no confirmation asked as confirm is off
         self.gdb.expect_exact("(gdb)")
         self.logger.debug("All previous breakpoints deleted")
 
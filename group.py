@@ -32,7 +32,7 @@ class Group:
     def copy_files_to_common_dir(self, base):
         members = self.members.replace(' ', '_')
         destination_directory = base + '/' + members
-        os.mkdir(destination_directory)
+        os.makedirs(destination_directory, exist_ok = True) # already there if a run is being redone
         for f in self.files_for_plag_check:
             source_path = "{d}/{f}".format(
                 d = self.submission_directory, f = f)
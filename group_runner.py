@@ -34,3 +34,4 @@ tester = TesterClass(submitter, logger.getChild('prac{n}'.format(n = args.p)))
 tester.catalogue_submission_files()
 tester.build()
 tester.run_tests()
+tester.rig.close()
@@ -45,7 +45,7 @@ class Individual:
                 self.submission_directory = "{base}/Submission attachment(s)/".format(base = self.directory)
                 self.logger.debug("Using dir: {d}".format(d = self.submission_directory))
                 return
-        raise NoDirectoryForGroup("No dir for individual: {uid}".format(uid = self.user_id))
+        raise NoDirectoryForIndividual("No dir for individual: {uid}".format(uid = self.user_id))
 
     def unzip_submission(self):
         os.chdir(self.submission_directory)
@@ -69,7 +69,7 @@ class Individual:
     def copy_files_to_common_dir(self, base):
         members = self.members.replace(' ', '_')
         destination_directory = base + '/' + members
-        os.mkdir(destination_directory)
+        os.makedirs(destination_directory, exist_ok = True) # already there if a run is being redone
         for f in self.files_for_plag_check:
             source_path = "{base}/{src}".format(base = self.submission_directory, src = f)
             destination_path = "{d}/{f}".format(d = destination_directory, f = f)
@@ -36,4 +36,5 @@ tester = TesterClass(submitter, logger.getChild('pe2'))
 tester.catalogue_submission_files()
 tester.build()
 tester.run_tests()
+tester.rig.close()
 logger.info("Final Mark: {m:g}".format(m = float(submitter.mark)))
@@ -1,67 +1,432 @@
 import serial
 import pexpect
 import elf_parser
+import trace_analysis
+from budget import BudgetExhausted
 import re
 import shlex, subprocess
 import time
+import struct
+import threading
+import numpy as np
 
 class LEDTimingTimeout(Exception):
     pass
 
+# pin levels for stimulus scripts. These match the shadow state values.
+SET = 'SET'
+CLEAR = 'CLEAR'
+HIGHZ = 'HIGHZ'
+
+class InterrogatorBatch:
+    """ Collects commands which are sent to the interrogator back to back when the
+    with block ends, rather than waiting for each OK in turn. Get one from
+    InterrogatorInterface.batch(). The responses are left in self.responses.
+    """
+    def __init__(self, ii):
+        self.ii = ii
+        self.commands = []
+        self.changes = {} # shadow entries to record once the batch has been acknowledged
+        self.responses = None
+
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            for key in self.changes:
+                self.ii.shadow.pop(key, None) # unknown until the OK arrives
+            self.responses = self.ii.send_batch(self.commands)
+            self.ii.shadow.update(self.changes)
+
+    def add(self, key, value, cmd):
+        # compare against what the earlier commands in this batch will have left behind
+        if self.changes.get(key, self.ii.shadow.get(key)) == value:
+            return
+        self.changes[key] = value
+        self.commands.append(cmd)
+
+    def reset(self, state):
+        self.commands.append("NRST {}".format(state))
+        self.changes.clear()
+        self.ii.shadow.clear()
+    def set_pin(self, pin):
+        self.add(('pin', pin), 'SET', "GPIO_SET {p}".format(p = pin))
+    def clear_pin(self, pin):
+        self.add(('pin', pin), 'CLEAR', "GPIO_CLEAR {p}".format(p = pin))
+    def highz_pin(self, pin):
+        self.add(('pin', pin), 'HIGHZ', "GPIO_HIGHZ {p}".format(p = pin))
+    def write_dac(self, channel, value):
+        self.add(('dac', channel), value, self.ii.dac_command(channel, value))
+
 class InterrogatorInterface:
-    def __init__(self):
-        self.ser = serial.Serial("/dev/ttyUSB0", baudrate=115200, timeout=10)
+    # how many commands may be waiting for their OK at once, so the interrogator's receive buffer can't overflow
+    PIPELINE_DEPTH = 4
+
+    MAX_STIMULUS_STEPS = 32
+    # an idle connection is PINGed before use if it has been quiet for longer than this, in seconds
+    PING_INTERVAL = 30
+    # how long a serial read waits for the interrogator, in seconds
+    READ_TIMEOUT = 10
+    # samples kept by the LED poller. At 100 samples a second this is about 10 minutes
+    POLL_CAPACITY = 65536
+    # optional firmware commands, probed for when the interrogator is first opened. Each maps to the probe
+    # sent and the start of the reply line which shows the firmware understood it, or None if a firmware
+    # with the command answers the probe with nothing but its echo
+    OPTIONAL_COMMANDS = {"CAPTURE": ("CAPTURE 0", b'EDGES:'),
+                         "STIMULUS": ("STIMULUS", None),
+                         "PATTERN_TRANSITION_STATS": ("PATTERN_TRANSITION_STATS", None)}
+    # how long a probe waits for OK. Firmware without the command never sends one
+    PROBE_TIMEOUT = 1
+
+    def __init__(self, device = "/dev/ttyUSB0"):
+        # last known pin modes and DAC values, so commands which wouldn't change anything can be skipped.
+        # Keys are ('pin', pin) or ('dac', channel). Anything missing is unknown.
+        self.shadow = {}
+        self.supported = {} # optional firmware commands -> whether this interrogator has them
+        self.device = device
+        # held for each exchange on the serial port, so the LED poller and test code can share it
+        self.lock = threading.RLock()
+        self.poller = None
+        self.read_timeout = self.READ_TIMEOUT
+        self.budget = None # the current submitter's Budget, which caps read_timeout
+        # set while a command's reply hasn't been read in full. If that is still so at the next
+        # exchange, the wait was cut short and the late reply must be cleared out first
+        self.out_of_step = False
+        self.open()
+        # probed now, before any submitter's budget starts, so no test pays for it
+        for cmd in self.OPTIONAL_COMMANDS:
+            self.supports(cmd)
+
+    def open(self):
+        self.ser = serial.Serial(self.device, baudrate=115200, timeout=self.read_timeout)
         self.ser.setBaudrate(9600)
         self.ser.setBaudrate(115200)
         self.comms_test()
 
+    def close(self):
+        self.stop_polling()
+        self.ser.close()
+
+    def reconnect(self):
+        """ Reopens the serial port, e.g. after the USB adapter has glitched
+        """
+        self.shadow.clear()
+        try:
+            self.ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        self.out_of_step = False
+        self.open()
+
+    def check_connection(self):
+        """ Cheap health check for a connection which is kept open across submitters.
+        Only PINGs if nothing has been heard for a while, and reconnects if that fails.
+        """
+        with self.lock:
+            if time.time() - self.last_contact < self.PING_INTERVAL and not self.out_of_step:
+                return
+            try:
+                self.comms_test()
+            except Exception:
+                self.reconnect()
+
+    def command(self, cmd):
+        """ Sends one command and returns the lines received before the OK.
+        If the serial port has gone away it is reopened and the command is sent once more.
+        """
+        with self.lock:
+            try:
+                return self.send_command(cmd)
+            except (serial.SerialException, OSError):
+                self.reconnect()
+                return self.send_command(cmd)
+
+    def send_command(self, cmd):
+        with self.lock:
+            self.resync_if_needed()
+            self.ser.flushInput()
+            self.ser.write("{c}\r".format(c = cmd).encode())
+            self.out_of_step = True
+            response = self.wait_for_OK()
+            self.out_of_step = False
+            return response
+
+    def resync_if_needed(self):
+        """ After a wait for a reply was cut short, by the budget or a timeout, the interrogator may
+        still send that reply. PINGs and throws away everything up to the PONG, so the late reply
+        can't be taken for the answer to a later command.
+        """
+        if not self.out_of_step:
+            return
+        self.shadow.clear() # can't tell whether the command which was cut short took effect
+        self.ser.flushInput()
+        self.ser.write(b"PING 1\r")
+        # not capped by the budget, as this tidies up after whoever was cut short
+        self.ser.timeout = self.READ_TIMEOUT
+        received = None
+        while received != b'PONG!':
+            received = self.ser.readline()
+            if received == b'':
+                raise Exception("No PONG from interrogator while resynchronising")
+            received = received.strip()
+        if self.ser.readline() != "OK\r\n".encode():
+            raise Exception("No OK after PONG from interrogator while resynchronising")
+        self.last_contact = time.time()
+        self.out_of_step = False
+
+    def set_serial_timeout(self):
+        """ Serial reads wait for read_timeout, or for what is left of the budget if that is less
+        """
+        timeout = self.read_timeout if self.budget is None else self.budget.timeout(self.read_timeout)
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
+
     def wait_for_OK(self):
         all_received = []
         while True: # keep adding the received line to the array until the received line is OK
+            self.set_serial_timeout()
             received = self.ser.readline()
             if received == "OK\r\n".encode():
+                self.last_contact = time.time()
                 return all_received
             if received == b'':
+                self.shadow.clear() # can't tell which commands took effect
                 raise Exception("Did not get OK from interrogator. Rather got: {r}.".format(r=all_received))
             all_received.append(received)
     
-    def assert_response(self, expected):
-        response = self.wait_for_OK()
+    def send_batch(self, commands):
+        """ Sends commands without waiting for each OK before sending the next.
+        Each response is matched to its command by the echoed command line.
+        Returns the responses in the same order as commands.
+        """
+        with self.lock:
+            self.resync_if_needed()
+            self.ser.flushInput()
+            responses = [None] * len(commands)
+            outstanding = [] # indices of commands sent but not yet answered
+            next_to_send = 0
+            while next_to_send < len(commands) or outstanding:
+                while next_to_send < len(commands) and len(outstanding) < self.PIPELINE_DEPTH:
+                    self.ser.write("{c}\r".format(c = commands[next_to_send]).encode())
+                    self.out_of_step = True
+                    outstanding.append(next_to_send)
+                    next_to_send += 1
+                response = self.wait_for_OK()
+                # the echo may have the '> ' prompt in front of it as nothing flushes it away between commands
+                echo = response[0].decode().lstrip('> ').strip() if response else ''
+                for idx in outstanding:
+                    if commands[idx] == echo:
+                        outstanding.remove(idx)
+                        responses[idx] = response
+                        break
+                # anything else is a stale reply to a command from before this batch, and is dropped
+            self.out_of_step = False
+            return responses
+
+    def batch(self):
+        return InterrogatorBatch(self)
+
+    def assert_response(self, response, expected):
         if response[1].strip().decode() !=  expected:
             raise Exception("Did not get response: {e}. Rather got: {r}".format(e=expected, r=response))
 
     def comms_test(self):
-        self.ser.flushInput()
-        self.ser.write("PING 1\r".encode())
-        self.assert_response("PONG!")
+        # no retry through command() here, as this is what open() uses to check a new connection
+        self.assert_response(self.send_command("PING 1"), "PONG!")
         return "Communications with interrogator established"
 
     def reset(self, state):
-        self.ser.flushInput()
-        self.ser.write("NRST {}\r".format(state).encode())
-        self.wait_for_OK()
+        self.shadow.clear()
+        self.command("NRST {}".format(state))
+
+    def send_if_changed(self, key, value, cmd):
+        if self.shadow.get(key) == value:
+            return
+        self.shadow.pop(key, None) # unknown until the OK arrives
+        self.command(cmd)
+        self.shadow[key] = value
 
     def set_pin(self, pin):
-        self.ser.flushInput()
-        self.ser.write("GPIO_SET {p}\r".format(p = pin).encode())
-        self.wait_for_OK()
+        self.send_if_changed(('pin', pin), 'SET', "GPIO_SET {p}".format(p = pin))
     def clear_pin(self, pin):
-        self.ser.flushInput()
-        self.ser.write("GPIO_CLEAR {p}\r".format(p = pin).encode())
-        self.wait_for_OK()
+        self.send_if_changed(('pin', pin), 'CLEAR', "GPIO_CLEAR {p}".format(p = pin))
     def highz_pin(self, pin):
-        self.ser.flushInput()
-        self.ser.write("GPIO_HIGHZ {p}\r".format(p = pin).encode())
-        self.wait_for_OK()
+        self.send_if_changed(('pin', pin), 'HIGHZ', "GPIO_HIGHZ {p}".format(p = pin))
+
+    def run_stimulus(self, script):
+        """ Plays a list of (pin, level, delay_us) steps: each pin is driven to SET, CLEAR or HIGHZ
+        and held for delay_us before the next step. The interrogator times the steps itself, so edges
+        don't depend on USB latency. Returns once the whole script has run.
+        """
+        if len(script) > self.MAX_STIMULUS_STEPS:
+            raise Exception("Stimulus script too long: {n} steps".format(n = len(script)))
+        if sum(delay for pin, level, delay in script) > 0.8 * self.read_timeout * 1e6:
+            raise Exception("Stimulus script would outlast the serial timeout")
+        if self.supports("STIMULUS"):
+            steps = ["{p}{l}{d}".format(p = pin, l = level[0], d = delay) for pin, level, delay in script]
+            for pin, level, delay in script:
+                self.shadow.pop(('pin', pin), None)
+            self.command("STIMULUS {s}".format(s = ','.join(steps)))
+            for pin, level, delay in script:
+                self.shadow[('pin', pin)] = level
+        else:
+            self.play_stimulus(script)
+
+    def supports(self, cmd):
+        """ Checks once whether the firmware has an optional command, by sending its probe from
+        OPTIONAL_COMMANDS. The probes do nothing, but interrogators without the command either don't
+        answer OK or answer it only after an error line, so the reply itself is checked too.
+        """
+        with self.lock:
+            if cmd not in self.supported:
+                probe, expected = self.OPTIONAL_COMMANDS[cmd]
+                self.read_timeout = self.PROBE_TIMEOUT
+                try:
+                    reply = self.command(probe)[1:] # after the echo
+                    if expected is None:
+                        self.supported[cmd] = not reply
+                    else:
+                        self.supported[cmd] = any(line.startswith(expected) for line in reply)
+                except BudgetExhausted:
+                    raise
+                except Exception:
+                    # whatever the firmware sends back late is cleared by the next exchange's resync
+                    self.supported[cmd] = False
+                finally:
+                    self.read_timeout = self.READ_TIMEOUT
+            return self.supported[cmd]
+
+    def play_stimulus(self, script):
+        """ Stand-in for interrogators without the STIMULUS command: plays the script from the host.
+        Edge timing then includes serial latency, as it used to.
+        """
+        for pin, level, delay in script:
+            self.send_if_changed(('pin', pin), level, "GPIO_{l} {p}".format(l = level, p = pin))
+            time.sleep(delay/1e6)
+
+    def capture_port(self, window):
+        """ Records the LEDs for window seconds. Returns a list of (time, pattern) pairs, one for
+        the pattern showing at the start (time 0) and one for each change after that.
+        """
+        if not self.supports("CAPTURE"):
+            return self.poll_capture(window)
+        with self.lock:
+            self.read_timeout = self.READ_TIMEOUT + window
+            try:
+                self.resync_if_needed()
+                self.ser.flushInput()
+                self.ser.write("CAPTURE {ms}\r".format(ms = int(window*1000)).encode())
+                self.out_of_step = True
+                self.set_serial_timeout()
+                self.ser.readline() # echo
+                # something like: b'EDGES: 12\r\n', followed by 12 records of a 4 byte cycle count and the pattern
+                header = self.ser.readline()
+                try:
+                    n_edges = int(header.split()[1]) if header.startswith(b'EDGES:') else None
+                except (IndexError, ValueError):
+                    n_edges = None
+                if n_edges is None:
+                    # the firmware didn't understand CAPTURE after all. The rest of its reply is cleared
+                    # by the next exchange's resync, as out_of_step is still set
+                    self.supported["CAPTURE"] = False
+                    blob = None
+                else:
+                    blob = self.ser.read(5 * n_edges)
+                    if len(blob) != 5 * n_edges:
+                        raise Exception("Capture truncated. Got {b} of {n} bytes".format(b = len(blob), n = 5 * n_edges))
+                    self.wait_for_OK()
+                    self.out_of_step = False
+            finally:
+                self.read_timeout = self.READ_TIMEOUT
+        if blob is None:
+            return self.poll_capture(window)
+        return [(cycles/48e6, pattern) for cycles, pattern in struct.iter_unpack("<IB", blob)]
+
+    def poll_capture(self, window):
+        """ Stand-in for interrogators without the CAPTURE command: polls the port from the host
+        """
+        t0 = time.time()
+        edges = [(0.0, self.read_port(0))]
+        while time.time() - t0 < window:
+            leds = self.read_port(0)
+            if leds != edges[-1][1]:
+                edges.append((time.time() - t0, leds))
+        return edges
+
+    def start_polling(self, rate = 100):
+        """ Opt-in: reads the LEDs rate times a second on a background thread, keeping the last
+        POLL_CAPACITY samples so tests can look back over what was shown with timeline().
+        Other commands can still be sent meanwhile; they take turns with the poller through self.lock.
+        """
+        if self.poller is not None:
+            return
+        self.poll_times = np.zeros(self.POLL_CAPACITY)
+        self.poll_values = np.zeros(self.POLL_CAPACITY, dtype=np.uint8)
+        self.poll_count = 0
+        self.poll_error = None
+        self.poll_lock = threading.Lock() # guards the ring buffer, not the serial port
+        self.poll_stop = threading.Event()
+        self.poller = threading.Thread(target = self.poll_leds, args = (1/rate,), daemon = True)
+        self.poller.start()
+
+    def stop_polling(self):
+        if self.poller is None:
+            return
+        self.poll_stop.set()
+        self.poller.join()
+        self.poller = None
+
+    def poll_leds(self, period):
+        next_sample = time.time()
+        try:
+            while not self.poll_stop.is_set():
+                t_sent = time.time()
+                leds = self.read_port(0)
+                t = (t_sent + time.time()) / 2 # the port was read somewhere in between
+                with self.poll_lock:
+                    idx = self.poll_count % self.POLL_CAPACITY
+                    self.poll_times[idx] = t
+                    self.poll_values[idx] = leds
+                    self.poll_count += 1
+                next_sample += period
+                delay = next_sample - time.time()
+                if delay <= 0:
+                    # fallen behind, so don't try to catch up. Still pause, so other commands get the lock
+                    next_sample = time.time()
+                    delay = 0.001
+                self.poll_stop.wait(delay)
+        except Exception as e:
+            self.poll_error = e
+
+    def timeline(self, t0 = 0, t1 = float('inf')):
+        """ The polled samples taken between t0 and t1 (as given by time.time()), oldest first, as an
+        (N, 2) array of (time, pattern) rows. This is a trace as used by trace_analysis.
+        """
+        if self.poller is None:
+            raise Exception("LED polling has not been started")
+        if isinstance(self.poll_error, BudgetExhausted):
+            raise self.poll_error # so run_tests reports the submitter as out of time
+        if self.poll_error is not None:
+            raise Exception("LED polling stopped: {e}".format(e = self.poll_error))
+        with self.poll_lock:
+            n = min(self.poll_count, self.POLL_CAPACITY)
+            idx = np.arange(self.poll_count - n, self.poll_count) % self.POLL_CAPACITY
+            times = self.poll_times[idx]
+            values = self.poll_values[idx]
+        wanted = (times >= t0) & (times <= t1)
+        return np.column_stack((times[wanted], values[wanted]))
+
+    def leds_between(self, t0, t1):
+        """ The set of patterns seen on the LEDs between t0 and t1
+        """
+        return set(int(p) for p in np.unique(self.timeline(t0, t1)[:, 1]))
 
     def write_port(self, port):
         pass
     def read_pin(self, pin):
         pass
     def read_port(self, port):
-        self.ser.flushInput()
-        self.ser.write("GPIO_READ 0\r".encode())
-        resp = self.wait_for_OK() #something like: [b'GPIO_READ 0\r\n', b'INPUTS: AA\r\n', b'> ']
+        resp = self.command("GPIO_READ 0") #something like: [b'GPIO_READ 0\r\n', b'INPUTS: AA\r\n', b'> ']
         try:
             assert(resp[0] == b'GPIO_READ 0\r\n') 
         except:
@@ -73,10 +438,8 @@ class InterrogatorInterface:
     def pattern_timing(self, pattern0, pattern1):
         pattern0 = pattern0 & 0xFF
         pattern1 = pattern1 & 0xFF
-        self.ser.flushInput()
         # the opcode consists of two bytes: the lower byte must be pattern0, the upper byte must be pattern1
-        self.ser.write("PATTERN_TIMING {p}\r".format(p = (pattern0) + (pattern1 << 8)).encode())
-        resp = self.wait_for_OK() # something like: [b'PATTERN_TIMING 0xAA5\r\n5', b'TIMING: 23889736\r\n']
+        resp = self.command("PATTERN_TIMING {p}".format(p = (pattern0) + (pattern1 << 8))) # something like: [b'PATTERN_TIMING 0xAA5\r\n5', b'TIMING: 23889736\r\n']
         cycles = int(resp[1].split()[1]) # second line, second word.
         if cycles == -1:
             return -1 # could not find patterns
@@ -89,21 +452,97 @@ class InterrogatorInterface:
         """
         pattern0 = pattern0 & 0xFF
         pattern1 = pattern1 & 0xFF
-        self.ser.flushInput()
         # the opcode consists of two bytes: the lower byte must be pattern0, the upper byte must be pattern1
-        self.ser.write("PATTERN_TRANSITION {p}\r".format(p = (pattern0) + (pattern1 << 8)).encode())
-        resp = self.wait_for_OK() # something like: [b'PATTERN_TIMING 0xAA5\r\n5', b'TIMING: 23889736\r\n']
+        resp = self.command("PATTERN_TRANSITION {p}".format(p = (pattern0) + (pattern1 << 8))) # something like: [b'PATTERN_TIMING 0xAA5\r\n5', b'TIMING: 23889736\r\n']
         cycles = int(resp[1].split()[1]) # second line, second word.
         if cycles == -1:
             raise LEDTimingTimeout()
         else:
             return cycles/48e6 # running at 48 MHz
 
-    def write_dac(self, channel, value):
+    def timing_transition_stats(self, pattern0, pattern1, k = 4, timeout = 20):
+        """ Times k occurrences of the p0 -> p1 transition (how long p1 stays on the LEDs each time)
+        and returns their statistics as a dict of count, min, mean, max and std, in seconds.
+        """
+        pattern0 = pattern0 & 0xFF
+        pattern1 = pattern1 & 0xFF
+        if not self.supports("PATTERN_TRANSITION_STATS"):
+            def k_timings(trace):
+                timings = trace_analysis.transition_timings(trace, pattern0, pattern1)
+                if len(timings) >= k:
+                    return timings[:k]
+            timings = self.watch_timeline(timeout, k_timings)
+            if timings is None:
+                raise LEDTimingTimeout()
+            return trace_analysis.jitter_stats(timings)
+        with self.lock:
+            self.read_timeout = max(self.READ_TIMEOUT, timeout)
+            try:
+                # something like: [b'PATTERN_TRANSITION_STATS 0x1FD 4\r\n', b'TIMINGS: 71998466 72000120 71999873 72000310\r\n']
+                resp = self.command("PATTERN_TRANSITION_STATS {p} {k}".format(p = pattern0 + (pattern1 << 8), k = k))
+            finally:
+                self.read_timeout = self.READ_TIMEOUT
+        cycles = [int(c) for c in resp[1].split()[1:]]
+        if -1 in cycles:
+            raise LEDTimingTimeout()
+        return trace_analysis.jitter_stats([c/48e6 for c in cycles]) # running at 48 MHz
+
+    def timing_transition_any(self, transitions, timeout = 10):
+        """ Like timing_transition, but watches for several (pattern0, pattern1) transitions at once.
+        Returns (index, timing) for the first of them to complete: its index in transitions and how
+        long its pattern1 stayed on the LEDs. Works from the LED poller's timeline, so the timing is
+        good to about one sample period.
+        """
+        transitions = [(p0 & 0xFF, p1 & 0xFF) for p0, p1 in transitions]
+        def first_transition(trace):
+            patterns, durations, previous = trace_analysis.segments(trace)
+            for p0, p1, duration in zip(previous, patterns, durations):
+                if (int(p0), int(p1)) in transitions:
+                    return transitions.index((int(p0), int(p1))), float(duration)
+        found = self.watch_timeline(timeout, first_transition)
+        if found is None:
+            raise LEDTimingTimeout()
+        return found
+
+    def wait_for_settle(self, timeout = 2, tolerance = 0.05):
+        """ For use after changing a DAC: watches how long each pattern stays on the LEDs and returns
+        as soon as two consecutive complete dwells agree to within tolerance (as a fraction), giving
+        their mean. Returns None if that hasn't happened within timeout seconds. PracTests.dac_timing_sweep
+        waits on this at every point, whether or not it then times a transition of its own.
+        """
+        def settled(trace):
+            patterns, durations, previous = trace_analysis.segments(trace)
+            if len(durations) >= 2 and trace_analysis.within_tolerance(durations[-1], durations[-2], tolerance):
+                return float(durations[-2:].mean())
+        return self.watch_timeline(timeout, settled)
+
+    def watch_timeline(self, timeout, check):
+        """ Calls check with the LEDs' timeline from now on, as it grows, until it returns something
+        other than None, and returns that. Returns None after timeout seconds. The poller is started
+        for the duration if it isn't already running.
+        """
+        if self.budget is not None:
+            timeout = self.budget.timeout(timeout)
+        started_poller = self.poller is None
+        self.start_polling()
+        try:
+            t0 = time.time()
+            while time.time() - t0 < timeout:
+                time.sleep(0.05)
+                result = check(self.timeline(t0))
+                if result is not None:
+                    return result
+            return None
+        finally:
+            if started_poller:
+                self.stop_polling()
+
+    def dac_command(self, channel, value):
         if (channel != 0) and (channel != 1):
             raise Exception("Invalid DAC channel")
         if (value < 0) or (value > 255):
             raise Exception("DAC value out of bounds")
-        self.ser.flushInput()
-        self.ser.write("DAC {val:#x}\r".format(val = ((channel << 8) + value)).encode())
-        self.wait_for_OK()
+        return "DAC {val:#x}".format(val = ((channel << 8) + value))
+
+    def write_dac(self, channel, value):
+        self.send_if_changed(('dac', channel), value, self.dac_command(channel, value))
@@ -0,0 +1,59 @@
+import json
+import os
+import time
+
+# Append-only record of a marking run, so that a run which dies part way through can be resumed
+# without re-testing everyone already marked. The first line describes the run itself and every
+# line after it is one finished submitter. Each line is flushed to disk as soon as it is written,
+# so at worst the line being written when the automarker died is lost. Only submitters whose
+# testing ran to the end are journaled; anyone whose marking was cut short is tested again on resume.
+
+class Journal:
+    def __init__(self, path, resume = False, **run_info):
+        """ Starts a new journal at path, keeping any existing one to the side, unless resume is set,
+        in which case the existing journal is read back and added to. run_info is recorded for a new
+        run, while a resumed run gets back the run_info it was started with.
+        """
+        self.path = path
+        self.run_info = run_info
+        self.completed = {} # user_id -> entry
+        if resume and os.path.exists(path):
+            self.replay()
+        else:
+            if os.path.exists(path):
+                os.replace(path, "{p}.{t}".format(p = path, t = time.strftime("%Y_%m_%d_%H_%M_%S")))
+            self.append(self.run_info)
+
+    def replay(self):
+        good_length = 0
+        with open(self.path, 'rb') as f:
+            for line_number, line in enumerate(f):
+                try:
+                    entry = json.loads(line.decode())
+                except ValueError:
+                    break # cut short by the crash, so this line and anything after it are dropped
+                if not line.endswith(b'\n'):
+                    break
+                good_length += len(line)
+                if line_number == 0:
+                    self.run_info = entry
+                else:
+                    self.completed[entry['user_id']] = entry
+        with open(self.path, 'r+b') as f:
+            f.truncate(good_length)
+        if good_length == 0:
+            # the crash cut short the very first line, so the run's own details need writing again
+            self.append(self.run_info)
+
+    def append(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, user_id, mark, **artefacts):
+        """ Records a finished submitter, with the paths of whatever it left behind
+        """
+        entry = dict(artefacts, user_id = user_id, mark = mark)
+        self.completed[user_id] = entry
+        self.append(entry)
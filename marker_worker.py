@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import json
+import os
+import select
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+
+# Everything a build does to the marker user's files goes through one long running worker process
+# per automarker process, started once with sudo and already running as marker. It takes jobs, each
+# a list of steps (copy a file, run a shell command), over its stdin and replies with one line on its
+# stdout, so a whole build's copies and patches cost one round trip rather than a sudo and a shell each.
+# Run this file directly to be the worker; MarkerWorker is the automarker's side.
+
+class MarkerWorker:
+    def __init__(self):
+        cmd = "sudo -u marker HOME=/home/marker {p} {w}".format(
+            p = shlex.quote(sys.executable), w = shlex.quote(os.path.abspath(__file__)))
+        self.proc = subprocess.Popen(shlex.split(cmd), stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+        self.pid = os.getpid()
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def run_job(self, steps):
+        """ Runs steps, a list of dicts, in order as marker and returns the worker's reply: a dict with
+        ok and, for the step which failed, its index as step plus returncode, timed_out, stdout and stderr.
+        """
+        # the worker enforces each step's timeout itself, so this only catches the worker getting stuck
+        backstop = sum(step.get('timeout', 10) for step in steps) + 5
+        self.proc.stdin.write(json.dumps(steps).encode() + b'\n')
+        self.proc.stdin.flush()
+        ready, _, _ = select.select([self.proc.stdout], [], [], backstop)
+        line = self.proc.stdout.readline() if ready else b''
+        if not line:
+            self.close()
+            return {'ok': False, 'step': None, 'returncode': None, 'timed_out': not ready,
+                    'stdout': '', 'stderr': "Marker worker stopped responding"}
+        return json.loads(line.decode())
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+
+_worker = None
+
+def worker():
+    """ This process's worker, started if there isn't one yet. A worker inherited through fork belongs
+    to the parent, so a forked process starts its own rather than talking over the parent's pipe.
+    """
+    global _worker
+    if _worker is None or _worker.pid != os.getpid() or not _worker.alive():
+        _worker = MarkerWorker()
+    return _worker
+
+def run_step(step):
+    if step['action'] == 'copy':
+        try:
+            shutil.copy(step['source'], step['destination'])
+        except OSError as e:
+            return {'ok': False, 'returncode': None, 'timed_out': False, 'stdout': '', 'stderr': str(e)}
+        return {'ok': True}
+    # each command gets a process group of its own, so that a timeout kills the command and everything
+    # it started without touching other builds running as marker
+    proc = subprocess.Popen(step['argv'], start_new_session = True,
+            stdin = subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    timed_out = False
+    try:
+        stdout, stderr = proc.communicate(timeout = step['timeout'])
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        stdout, stderr = proc.communicate()
+        timed_out = True
+    return {'ok': proc.returncode == 0 and not timed_out, 'returncode': proc.returncode, 'timed_out': timed_out,
+            'stdout': stdout.decode(errors = 'replace'), 'stderr': stderr.decode(errors = 'replace')}
+
+def serve():
+    for line in sys.stdin:
+        reply = {'ok': True, 'step': None}
+        for index, step in enumerate(json.loads(line)):
+            result = run_step(step)
+            if not result['ok']:
+                reply = dict(result, step = index)
+                break
+        sys.stdout.write(json.dumps(reply) + '\n')
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    serve()
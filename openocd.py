@@ -1,22 +1,61 @@
 import shlex
+import socket
 import subprocess
 import time
+from rig import DEFAULT_RIG
+
+class OpenOCDException(Exception):
+    pass
 
 class OpenOCD:
-    def __init__(self, logger):
+    # lines in the OpenOCD log which mean the debug connection to the target has broken
+    FAILURE_MESSAGES = ["Error: open failed",
+                        "Error: init mode failed",
+                        "Error: jtag status contains invalid mode value",
+                        "Polling target stm32f0x.cpu failed",
+                        "Error: couldn't read",
+                        "Error: error writing"]
+
+    def __init__(self, logger, rig = DEFAULT_RIG):
         self.logger = logger
-        self.logger.debug("Attempting to launch OpenOCD")
-        openocdcmd = shlex.split("openocd -f interface/stlink-v2.cfg -f target/stm32f0x_stlink.cfg -c init -c \"reset halt\"")
-        self.logfile = open('/tmp/automarker_openocd.log', 'a')
+        self.rig = rig
+        self.tcl = None
+        self.logger.debug("Attempting to launch OpenOCD for {r}".format(r = rig))
+        openocdcmd = "openocd -f interface/stlink-v2.cfg"
+        if rig.stlink_serial is not None:
+            # pick out this rig's ST-Link when several are plugged into the host
+            openocdcmd += " -c \"hla_serial {s}\"".format(s = rig.stlink_serial)
+        openocdcmd += " -f target/stm32f0x_stlink.cfg"
+        openocdcmd += " -c \"gdb_port {g}\" -c \"tcl_port {t}\" -c \"telnet_port {n}\"".format(
+            g = rig.gdb_port, t = rig.tcl_port, n = rig.telnet_port)
+        openocdcmd += " -c init -c \"reset halt\""
+        openocdcmd = shlex.split(openocdcmd)
+        self.logfile_name = '/tmp/automarker_openocd_{r}.log'.format(r = rig.name)
+        self.logfile = open(self.logfile_name, 'a')
+        self.log_position = self.logfile.tell() # only look at what this instance writes to the log
         self.openocd = subprocess.Popen(openocdcmd, stderr=self.logfile, stdout=self.logfile)
-        time.sleep(0.5)
-        if self.openocd.poll() == None:
-            self.logger.info("OpenOCD running")
-        else:
-            raise Exception("OpenOCD not running, but should be")
+        self.wait_until_listening()
+        self.logger.info("OpenOCD running")
+
+    def wait_until_listening(self, timeout = 5):
+        """ Returns as soon as the Tcl port accepts connections, rather than sleeping for a fixed time.
+        """
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            if self.openocd.poll() != None:
+                raise OpenOCDException("OpenOCD not running, but should be")
+            try:
+                self.tcl = socket.create_connection(("localhost", self.rig.tcl_port), timeout = 5)
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise OpenOCDException("OpenOCD did not start listening within {t} seconds".format(t = timeout))
 
     def exit(self):
+        if self.tcl is not None:
+            self.tcl.close()
         self.openocd.kill()
+        self.openocd.wait()
         self.logfile.close()
 
     def __enter__(self):
@@ -26,3 +65,90 @@ class OpenOCD:
 
     def poll(self):
         return self.openocd.poll()
+
+    def new_log_lines(self):
+        with open(self.logfile_name) as log:
+            log.seek(self.log_position)
+            lines = log.readlines()
+            self.log_position = log.tell()
+        return lines
+
+    def is_healthy(self):
+        """ Checks the process is still alive and nothing alarming has been logged since the last check
+        """
+        if self.openocd.poll() != None:
+            self.logger.critical("OpenOCD has exited with code {c}".format(c = self.openocd.poll()))
+            return False
+        for line in self.new_log_lines():
+            for failure in self.FAILURE_MESSAGES:
+                if failure in line:
+                    self.logger.critical("OpenOCD reported: {l}".format(l = line.strip()))
+                    return False
+        return True
+
+    def send_tcl_command(self, cmd):
+        """ Runs a command through OpenOCD's Tcl server, where requests and responses end in 0x1A
+        """
+        self.tcl.sendall(cmd.encode() + b'\x1a')
+        response = b''
+        while not response.endswith(b'\x1a'):
+            received = self.tcl.recv(4096)
+            if received == b'':
+                raise OpenOCDException("OpenOCD closed the Tcl connection")
+            response += received
+        return response[:-1].decode().strip()
+
+    def target_state(self):
+        return self.send_tcl_command("[target current] curstate")
+
+    def reset_halt(self):
+        self.send_tcl_command("reset halt")
+        state = self.target_state()
+        if state != "halted":
+            raise OpenOCDException("Target not halted after reset. State: {s}".format(s = state))
+        self.logger.debug("Target reset and halted")
+
+class OpenOCDSession:
+    """ Keeps one OpenOCD running for a rig across many submitters.
+    attach() is called before each submitter: it resets and halts the target through the running
+    OpenOCD and only restarts OpenOCD if it has died, logged a failure or cannot reset the target.
+    """
+    def __init__(self, logger, rig = DEFAULT_RIG):
+        self.logger = logger
+        self.rig = rig
+        self.openocd = None
+
+    def start(self, ii):
+        self.logger.info("Starting OpenOCD for {r}".format(r = self.rig))
+        ii.reset(0) # pull NRST low
+        time.sleep(1)
+        self.openocd = OpenOCD(self.logger, self.rig)
+        ii.reset(1) # release NRST to allow openocd to connect
+        self.openocd.reset_halt()
+
+    def restart(self, ii):
+        self.logger.warning("Restarting OpenOCD")
+        self.close()
+        self.start(ii)
+
+    def attach(self, ii):
+        """ Returns True if OpenOCD had to be (re)started, which drops any existing GDB connection
+        """
+        if self.openocd is None:
+            self.start(ii)
+            return True
+        if not self.openocd.is_healthy():
+            self.restart(ii)
+            return True
+        try:
+            self.openocd.reset_halt()
+        except (OSError, OpenOCDException) as e:
+            self.logger.critical("Could not reset target through running OpenOCD: {e}".format(e = e))
+            self.restart(ii)
+            return True
+        return False
+
+    def close(self):
+        if self.openocd is not None:
+            self.openocd.exit()
+            self.openocd = None
@@ -37,10 +37,11 @@ class Prac2Tests(PracTests):
         self.gdb.erase()
         self.gdb.load()
         self.gdb.send_continue()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         self.ii.write_dac(0xFF)
         try:
             self.logger.info("----------- PART 1 ----------------")
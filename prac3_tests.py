@@ -22,12 +22,11 @@ class Prac3Tests(PracTests):
             self.submitter.sfiles
 
     def build(self):
-        os.chdir(self.submitter.submission_directory)
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
         self.logger.info("Running assembler in submission directory")
         try:
             self.exec_as_marker("arm-none-eabi-as -g -mthumb -mcpu=cortex-m0 -o main.o {s}".format(s = self.submitter.sfiles[0]))
@@ -52,11 +51,12 @@ class Prac3Tests(PracTests):
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.load()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
         try:
             self.logger.info("----------- PART 1 ----------------")
             self.part_1_tests()
@@ -90,16 +90,15 @@ class Prac3Tests(PracTests):
                         0xD8, 0xE7, 0xF2, 0xFE]
         self.gdb.run_to_label('stack_push_done')
         pointer = 0x20002000 - (4 * len(expected_values))
-        for expected_value in expected_values:
-            actual_value = self.gdb.read_word(pointer)
+        actual_values = self.gdb.read_block(pointer, len(expected_values))
+        for idx, (expected_value, actual_value) in enumerate(zip(expected_values, actual_values)):
             self.logger.info("At address {addr:#x} expected {exp:#x} and found {act:#x}".format(
-                addr = pointer,
+                addr = pointer + 4*idx,
                 exp = expected_value,
                 act = actual_value))
             if actual_value != expected_value:
                 self.logger.critical("Incorrect.")
                 raise TestFailedError
-            pointer += 4
         self.submitter.increment_mark(2)
         self.logger.info("Changing address 0x20001FE0 to value 0x0000009A")
         self.gdb.write_word(0x20001FE0, 0x0000009A)
@@ -115,12 +114,8 @@ class Prac3Tests(PracTests):
         try:
             timing = round(self.ii.timing_transition(0x99, 0x9A))
         except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(1)
-            p1 = self.ii.read_port(1)
             self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
+            self.log_led_activity(2)
             return
         self.logger.info("Found transition: part2 must be correct for a value not at the end of the stack.")
         self.submitter.increment_mark(1)
@@ -138,12 +133,8 @@ class Prac3Tests(PracTests):
             self.logger.info("Found pattern. Part 2 must be correct even for end of stack edge case")
             self.submitter.increment_mark(1)
         except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(1)
-            p1 = self.ii.read_port(1)
             self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
+            self.log_led_activity(2)
             self.logger.error("Not awarding full marks")
         self.gdb.send_control_c()
         self.gdb.soft_reset()
@@ -151,12 +142,8 @@ class Prac3Tests(PracTests):
         try:
             timing = round(self.ii.timing_transition(0x5E, 0x62))
         except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(1)
-            p1 = self.ii.read_port(1)
             self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
+            self.log_led_activity(2)
             self.logger.info("This should not be possible.....")
             return
         self.logger.info("Timing should be 1 second. Found to be {t} seconds.".format(t=timing))
@@ -173,9 +160,8 @@ class Prac3Tests(PracTests):
         self.gdb.send_continue()
         self.logger.info("Holding SW0")
         self.ii.clear_pin(0)
-        time.sleep(2)
         self.ii.write_dac(0, 0)
-        time.sleep(0.5)
+        self.wait_until(self.leds_in_range(0, 5), 2.5)
         leds = self.ii.read_port(0)
         self.logger.info("Pot set to 0V, expecting 0 on LEDs")
         self.logger.info("LEDs found to display: {l:#x}".format(l = leds))
@@ -183,7 +169,7 @@ class Prac3Tests(PracTests):
             self.logger.critical("Too far out")
             raise TestFailedError
         self.ii.write_dac(0, 0x30)
-        time.sleep(0.5)
+        self.wait_until(self.leds_in_range(0x25, 0x35), 0.5)
         leds = self.ii.read_port(0)
         self.logger.info("Pot set to 0.62V, expecting 0x30 on LEDs")
         self.logger.info("LEDs found to display: {l:#x}".format(l = leds))
@@ -191,7 +177,7 @@ class Prac3Tests(PracTests):
             self.logger.critical("Too far out")
             raise TestFailedError
         self.ii.write_dac(0, 0xDD)
-        time.sleep(0.5)
+        self.wait_until(self.leds_in_range(0xD5, 0xE4), 0.5)
         leds = self.ii.read_port(0)
         self.logger.info("Pot set to 2.86V, expecting 0xDD on LEDs")
         self.logger.info("LEDs found to display: {l:#x}".format(l = leds))
@@ -4,6 +4,7 @@ import subprocess
 from prac_tests import PracTests, TestFailedError, BuildFailedError
 import interrogator_interface
 import gdb_interface
+import trace_analysis
 
 class Prac4Tests(PracTests):
     def catalogue_submission_files(self):
@@ -27,45 +28,36 @@ class Prac4Tests(PracTests):
             self.submitter.sfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        all_files = os.listdir()
+        os.chdir(self.workspace)
+        # the workspace is emptied first, so what's in it afterwards is exactly the files copied
+        all_files = [os.path.basename(f) for f in self.submitter.files_to_mark]
         s_files = [fi for fi in all_files if fi.endswith(".s")]
         if len(s_files) != 1:
             self.logger.critical("Too many or too few .s files found. Should be only 1 .s file. Actual directory contents: {af}".format(af = all_files))
             raise BuildFailedError
         self.logger.info("Found only 1 .s file. Good!")
-        cmd = "sed -i \"s/.word 0xfbe4bc46/.word 0x0674a70b\\n .word 0x0674a70b\\n .word 0x55AA55AA\\n .word 0xFD0155AA\\n/g\" {f}".format(f = s_files[0])
-        self.exec_as_marker(cmd)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+            cmd = "sed -i \"s/.word 0xfbe4bc46/.word 0x0674a70b\\n .word 0x0674a70b\\n .word 0x55AA55AA\\n .word 0xFD0155AA\\n/g\" {f}".format(f = s_files[0])
+            self.exec_as_marker(cmd)
         self.logger.info("Your source file has been modified to replace .word 0xfbe4bc46 with .word 0x0674a70b .word 0x0674a70b .word 0x55AA55AA 0xFD0155AA")
         self.logger.info("The DATA block is a tad longer and now the best pair should be 0xFD and 0x01")
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("timeout 5 make")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        self.make("timeout 5 make")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.load()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
+            batch.write_dac(1, 0)
         try:
             self.logger.info("----------- PART 1 ----------------")
             self.part_1_tests()
@@ -98,10 +90,8 @@ class Prac4Tests(PracTests):
 
     def part_1_tests(self):
         self.logger.info("Wiping RAM")
-        for address in range(0x20000000, 0x20000000+(20*4), 4):
-            self.gdb.write_word(address, 0)
-        for address in range(0x20001FE0, 0x20002000+(20*4), 4):
-            self.gdb.write_word(address, 0)
+        self.gdb.fill(0x20000000, 20, 0)
+        self.gdb.fill(0x20001FE0, 28, 0) # 0x20001FE0 up to 0x20002000+(20*4)
         expected_values = [0x62967109,
                            0x0674a70b,
                            0x902bff4f,
@@ -116,17 +106,15 @@ class Prac4Tests(PracTests):
                            0x55AA55AA,
                            0xFD0155AA]
         self.gdb.run_to_label('copy_to_RAM_done')
-        pointer = 0x20000000
-        for expected_value in expected_values:
-            actual_value = self.gdb.read_word(pointer)
+        actual_values = self.gdb.read_block(0x20000000, len(expected_values))
+        for idx, (expected_value, actual_value) in enumerate(zip(expected_values, actual_values)):
             self.logger.info("At address {addr:#x} expected {exp:#x} and found {act:#x}".format(
-                addr = pointer,
+                addr = 0x20000000 + 4*idx,
                 exp = expected_value,
                 act = actual_value))
             if actual_value != expected_value:
                 self.logger.critical("Incorrect.")
                 return
-            pointer += 4
         self.submitter.increment_mark(1)
 
     def part_2_tests(self):
@@ -166,35 +154,30 @@ class Prac4Tests(PracTests):
             self.logger.info("Attempting to find either the transition: {p0:#x}->{p1:#x} or {p2:#x}->{p3:#x}".format(
                 p0 = 0x01, p1 = 0xFD, p2 = self.part_2_top, p3 = self.part_2_second))
             try:
-                timing = round(self.ii.timing_transition(0xFD, 0x01), 2)
+                found, timing = self.ii.timing_transition_any([(0xFD, 0x01), (self.part_2_top, self.part_2_second)])
+                timing = round(timing, 2)
+            except interrogator_interface.LEDTimingTimeout as e:
+                self.logger.critical("Could not find either patterns.")
+                self.log_led_activity(3)
+                return
+            if found == 0:
                 self.part_2_top = 0xFD
                 self.part_2_second = 0x01
-            except interrogator_interface.LEDTimingTimeout as e:
-                try:
-                    timing = round(self.ii.timing_transition(self.part_2_top, self.part_2_second), 2)
-                except interrogator_interface.LEDTimingTimeout as e:
-                    p0 = self.ii.read_port(0)
-                    time.sleep(1.5)
-                    p1 = self.ii.read_port(1)
-                    self.logger.critical("Could not find either patterns.")
-                    self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                        p0 = p0, p1 = p1))
-                    return
         else:
             self.logger.info("Checking timing for pattern transition: {p0:#X}->{p1:#X}".format(
                 p0 = 0xFD, p1 = 0x01))
             try:
-                timing = round(self.ii.timing_transition(0xFD, 0x01), 2)
+                # averaged over a few periods so one jittery period doesn't cost the mark
+                stats = self.ii.timing_transition_stats(0xFD, 0x01, k = 3)
                 self.part_2_top = 0xFD
                 self.part_2_second = 0x01
             except interrogator_interface.LEDTimingTimeout as e:
-                p0 = self.ii.read_port(0)
-                time.sleep(1.5)
-                p1 = self.ii.read_port(1)
                 self.logger.critical("LEDs did not seem to display expected pattern")
-                self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                    p0 = p0, p1 = p1))
+                self.log_led_activity(3)
                 return
+            self.logger.info("Over {n} periods, timing ranged from {mn:.3f} to {mx:.3f} seconds (std {sd:.3f})".format(
+                n = stats['count'], mn = stats['min'], mx = stats['max'], sd = stats['std']))
+            timing = round(stats['mean'], 2)
         self.logger.info("Timing should be 1.5 seconds. Found to be {t} seconds.".format(t=timing))
         if (timing >= 1.5*0.95) and (timing <= 1.5*1.05):
             self.logger.info("Correct")
@@ -206,117 +189,23 @@ class Prac4Tests(PracTests):
     def part_4_tests(self):
         self.logger.info("Holding SW0")
         self.ii.clear_pin(0)
-        self.logger.info("Setting POT0 to 0xD0 and POT1 to 0")
-        self.ii.write_dac(0, 0xD0)
-        time.sleep(2)
-        self.logger.info("Timing should be 0.85 seconds")
-        try:
-            timing = round(self.ii.timing_transition(self.part_2_top, self.part_2_second), 2)
-        except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(0.85)
-            p1 = self.ii.read_port(1)
-            self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
-            return
-        self.logger.info("Found to be {t} seconds.".format(t=timing))
-        if (timing >= 0.85*0.95) and (timing <= 0.85*1.05):
-            self.logger.info("Correct")
-        else:
-            self.logger.critical("Too far out.")
-            return
-
-        self.logger.info("Setting POT0 to 0x40 and POT1 to 0")
-        self.ii.write_dac(0, 0x55)
-        time.sleep(2)
-        self.logger.info("Timing should be 0.47 seconds")
-        try:
-            timing = round(self.ii.timing_transition(self.part_2_top, self.part_2_second), 2)
-        except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(0.47)
-            p1 = self.ii.read_port(1)
-            self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
-            return
-        self.logger.info("Found to be {t} seconds.".format(t=timing))
-        if (timing >= 0.47*0.95) and (timing <= 0.47*1.05):
+        results = self.dac_timing_sweep([(0xD0, None), (0x55, None)], [0.85, 0.47], self.time_part_2_transition)
+        if trace_analysis.within_tolerance(results['measured'].round(2), results['expected']).all():
             self.logger.info("Correct")
+            self.submitter.increment_mark(2)
         else:
             self.logger.critical("Too far out.")
-            return
-        self.submitter.increment_mark(2)
 
     def part_5_tests(self):
-        self.logger.info("Setting POT0 to 0x30 and POT1 to 0x60")
-        self.ii.write_dac(0, 0x30)
-        self.ii.write_dac(1, 0x60)
-        time.sleep(2)
-        self.logger.info("Timing should be 0.5 seconds")
-        try:
-            timing = round(self.ii.timing_transition(self.part_2_top, self.part_2_second), 2)
-        except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(0.5)
-            p1 = self.ii.read_port(1)
-            self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
-            return
-        self.logger.info("Found to be {t} seconds.".format(t=timing))
-        if (timing >= 0.5*0.95) and (timing <= 0.5*1.05):
-            self.logger.info("Correct")
-        else:
-            self.logger.critical("Too far out.")
-            return
-
-        self.logger.info("Setting POT0 to 0x00 and POT1 to 0x0")
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0)
-        time.sleep(2)
-        self.logger.info("Timing should be 0.2 seconds")
-        try:
-            timing = round(self.ii.timing_transition(self.part_2_top, self.part_2_second), 2)
-        except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(0.2)
-            p1 = self.ii.read_port(1)
-            self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
-            return
-        self.logger.info("Found to be {t} seconds.".format(t=timing))
-        if (timing >= 0.2*0.95) and (timing <= 0.2*1.05):
-            self.logger.info("Correct")
-        else:
-            self.logger.critical("Too far out.")
-            return
-
-        self.logger.info("Setting POT0 to 0xF0 and POT1 to 0xE0")
-        self.ii.write_dac(0, 0xF0)
-        self.ii.write_dac(1, 0xE0)
-        time.sleep(2)
-        self.logger.info("Timing should be 0.95 seconds")
-        try:
-            timing = round(self.ii.timing_transition(self.part_2_top, self.part_2_second), 2)
-        except interrogator_interface.LEDTimingTimeout as e:
-            p0 = self.ii.read_port(0)
-            time.sleep(0.95)
-            p1 = self.ii.read_port(1)
-            self.logger.critical("LEDs did not seem to display expected pattern")
-            self.logger.info("Rather, seemed to be displaying {p0:#X} and {p1:#X}".format(
-                p0 = p0, p1 = p1))
-            return
-        self.logger.info("Found to be {t} seconds.".format(t=timing))
-        if (timing >= 0.95*0.95) and (timing <= 0.95*1.05):
+        results = self.dac_timing_sweep([(0x30, 0x60), (0, 0), (0xF0, 0xE0)], [0.5, 0.2, 0.95], self.time_part_2_transition)
+        if trace_analysis.within_tolerance(results['measured'].round(2), results['expected']).all():
             self.logger.info("Correct")
+            self.submitter.increment_mark(2)
         else:
             self.logger.critical("Too far out.")
-            return
 
-        self.submitter.increment_mark(2)
+    def time_part_2_transition(self):
+        return self.ii.timing_transition(self.part_2_top, self.part_2_second)
 
     def adjust_mark(self):
         if self.submitter.submission_time < time.strptime("27 August 2015 09:55", "%d %B %Y %H:%M"):
@@ -28,41 +28,31 @@ class Prac5Tests(PracTests):
             self.submitter.sfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+            cmd = "sed -i \"s/.word 0xBBAA5500/.word 0x55443366/g\" {f}".format(f = self.submitter.sfiles[0])
             self.exec_as_marker(cmd)
-        cmd = "sed -i \"s/.word 0xBBAA5500/.word 0x55443366/g\" {f}".format(f = self.submitter.sfiles[0])
-        self.exec_as_marker(cmd)
-        self.logger.info("Your source file has been modified to replace .word 0xBBAA5500 with .word 0x55443366")
-        cmd = "sed -i \"s/.word 0xFFEEDDCC/.word 0x8877DDCC/g\" {f}".format(f = self.submitter.sfiles[0])
-        self.exec_as_marker(cmd)
-        self.logger.info("Your source file has been modified to replace .word 0xFFEEDDCC with .word 0x8877DDCC")
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+            self.logger.info("Your source file has been modified to replace .word 0xBBAA5500 with .word 0x55443366")
+            cmd = "sed -i \"s/.word 0xFFEEDDCC/.word 0x8877DDCC/g\" {f}".format(f = self.submitter.sfiles[0])
+            self.exec_as_marker(cmd)
+            self.logger.info("Your source file has been modified to replace .word 0xFFEEDDCC with .word 0x8877DDCC")
+        self.make("make")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.load()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
+            batch.write_dac(1, 0)
         try:
             self.logger.info("----------- PART 1 ----------------")
             self.part_1_tests()
@@ -116,9 +106,9 @@ class Prac5Tests(PracTests):
     def part_2_tests(self):
         self.ii.clear_pin(0)
         self.logger.info("Asserting SW0")
-        time.sleep(3)
+        # the pattern showing when SW0 went down may still be on the old timing, so start from the next one
+        self.wait_until(self.leds_changed(), 3)
         leds = self.ii.read_port(0)
-        time.sleep(1)
         try:
             timing = round(self.ii.timing_transition(leds+1, leds+2), 2)
         except interrogator_interface.LEDTimingTimeout as e:
@@ -133,7 +123,7 @@ class Prac5Tests(PracTests):
             return
         self.ii.highz_pin(0)
         self.logger.info("Releasing SW0 to check that timing returns to normal")
-        time.sleep(3)
+        self.wait_until(self.leds_changed(), 3)
         leds = self.ii.read_port(0)
         try:
             timing = round(self.ii.timing_transition(leds+1, leds+2), 2)
@@ -153,13 +143,9 @@ class Prac5Tests(PracTests):
         self.ii.clear_pin(1)
         self.gdb.send_continue()
         patterns = [0x66, 0x33, 0x44, 0x55, 0xCC, 0xDD, 0x77, 0x88]
-        t0 = time.time()
-        while(True):
-            if (self.ii.read_port(0) == patterns[0]):
-                break
-            if (time.time() - t0 > 10):
-                self.logger.critical("Could not find starting pattern in sequence. Aborting")
-                raise TestFailedError
+        if not self.wait_until(self.leds_equal(patterns[0]), 10):
+            self.logger.critical("Could not find starting pattern in sequence. Aborting")
+            raise TestFailedError
         for lower_idx in range(1, 12, 2):
             p0 = patterns[lower_idx % len(patterns)]
             p1 = patterns[(lower_idx+1) % len(patterns)]
@@ -185,13 +171,9 @@ class Prac5Tests(PracTests):
         self.gdb.soft_reset()
         self.gdb.send_continue()
         patterns = [0x66, 0x33, 0x44, 0x55, 0xCC, 0xDD, 0x77, 0x88]
-        t0 = time.time()
-        while(True):
-            if (self.ii.read_port(0) == patterns[0]):
-                break
-            if (time.time() - t0 > 20):
-                self.logger.critical("Could not find starting pattern in sequence. Aborting")
-                raise TestFailedError
+        if not self.wait_until(self.leds_equal(patterns[0]), 20):
+            self.logger.critical("Could not find starting pattern in sequence. Aborting")
+            raise TestFailedError
         for lower_idx in range(2, 12, 2):
             p0 = patterns[lower_idx % len(patterns)]
             p1 = patterns[(lower_idx+1) % len(patterns)]
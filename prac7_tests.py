@@ -38,23 +38,12 @@ class Prac7Tests(PracTests):
             self.submitter.ldfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make -B")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+        self.make("make -B")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
@@ -70,12 +59,13 @@ class Prac7Tests(PracTests):
             self.gdb.verify()
         except gdb_interface.CodeVerifyFailed as e:
             return
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
+            batch.write_dac(1, 0)
         try:
             self.logger.info("----------- PART 1 ----------------")
             self.part_1_tests()
@@ -93,16 +83,17 @@ class Prac7Tests(PracTests):
             self.logger.critical("LEDs timing checker timed out before finding expected patterns")
         except gdb_interface.GDBException as e:
             self.logger.critical("Your program did not respond the way GDB expected it to")
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
+            batch.write_dac(1, 0)
 
     def part_1_tests(self):
         self.gdb.send_continue()
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0xC0), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("Found on LEDs: {l:#x}".format(l = leds))
         if leds != 0xC0:
@@ -166,21 +157,21 @@ class Prac7Tests(PracTests):
         self.logger.info("Holding SW2")
         self.ii.clear_pin(2)
         self.ii.write_dac(0, 0x40)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0x40*0.9, 0x40*1.1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For POT0 value of 0x40, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0x40*1.1) or (leds < 0x40*0.9):
             self.logger.critical("Wrong.")
             return
         self.ii.write_dac(0, 0x78)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0x78*0.9, 0x78*1.1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For POT0 value of 0x78, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0x78*1.1) or (leds < 0x78*0.9):
             self.logger.critical("Wrong.")
             return
         self.ii.write_dac(0, 0xCC)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0xCC*0.9, 0xCC*1.1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For POT0 value of 0xCC, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0xCC*1.1) or (leds < 0xCC*0.9):
@@ -195,21 +186,21 @@ class Prac7Tests(PracTests):
         self.logger.info("Holding SW3")
         self.ii.clear_pin(3)
         self.ii.write_dac(1, 0xFF - 0x40)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0x40*0.9, 0x40*1.1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For POT1 value of 0xFF - 0x40, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0x40*1.1) or (leds < 0x40*0.9):
             self.logger.critical("Wrong.")
             return
         self.ii.write_dac(1, 0xFF - 0x78)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0x78*0.9, 0x78*1.1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For POT1 value of 0xFF - 0x78, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0x78*1.1) or (leds < 0x78*0.9):
             self.logger.critical("Wrong.")
             return
         self.ii.write_dac(1, 0xFF - 0xCC)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0xCC*0.9, 0xCC*1.1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For POT1 value of 0xFF - 0xCC, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0xCC*1.1) or (leds < 0xCC*0.9):
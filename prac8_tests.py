@@ -39,23 +39,12 @@ class Prac8Tests(PracTests):
             self.submitter.ldfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+        self.make("make")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
@@ -28,39 +28,29 @@ class Prac9Tests(PracTests):
             self.submitter.headerfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        for f in self.submitter.sourcefiles:
-            cmd = "sed -i \"s/{{0x00, 0x81, 0xC3, 0xE7, 0xFF, 0x7E, 0x3C, 0x18}}/{{0x42, 0x69, 0xAA, 0xBB, 0xA1}}/g\" {f}".format(f = f)
-            self.exec_as_marker(cmd)
-            cmd = "sed -i \"s/{{0x81, 0xC3, 0xE7, 0xFF, 0x7E, 0x3C, 0x18, 0x00}}/{{0x42, 0x69, 0xAA, 0xBB, 0xA1}}/g\" {f}".format(f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Replaced array with {0x42, 0x69, 0xAA, 0xBB, 0xA1}")
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+            for f in self.submitter.sourcefiles:
+                cmd = "sed -i \"s/{{0x00, 0x81, 0xC3, 0xE7, 0xFF, 0x7E, 0x3C, 0x18}}/{{0x42, 0x69, 0xAA, 0xBB, 0xA1}}/g\" {f}".format(f = f)
+                self.exec_as_marker(cmd)
+                cmd = "sed -i \"s/{{0x81, 0xC3, 0xE7, 0xFF, 0x7E, 0x3C, 0x18, 0x00}}/{{0x42, 0x69, 0xAA, 0xBB, 0xA1}}/g\" {f}".format(f = f)
+                self.exec_as_marker(cmd)
+            self.logger.info("Replaced array with {0x42, 0x69, 0xAA, 0xBB, 0xA1}")
+        self.make("make")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -99,7 +89,7 @@ class Prac9Tests(PracTests):
 
     def part_1_tests(self):
         self.gdb.send_continue()
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0x42), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("Leds should show 0x42, found to show: {l:#x}".format(l = leds))
         if leds == 0x42:
@@ -150,15 +140,11 @@ class Prac9Tests(PracTests):
             self.submitter.increment_mark(1)
         else:
             self.logger.critical("Too far out. Not awarding marks")
-        t0 = time.time()
         self.logger.info("Checking that it wrapps back around to element 0")
-        while(True):
-            if (self.ii.read_port(0) == self.patterns[-1]):
-                break
-            if (time.time() - t0 > 10):
-                self.logger.critical("Could not find last pattern in sequence. Aborting")
-                raise TestFailedError
-        time.sleep(0.75)
+        if not self.wait_until(self.leds_equal(self.patterns[-1]), 10):
+            self.logger.critical("Could not find last pattern in sequence. Aborting")
+            raise TestFailedError
+        self.wait_until(self.leds_changed(self.patterns[-1]), 0.75)
         leds = self.ii.read_port(0)
         self.logger.info("After last pattern in array, LEDs went to: {l:#x}".format(l = leds))
         if leds != self.patterns[0]:
@@ -183,6 +169,7 @@ class Prac9Tests(PracTests):
         self.ii.clear_pin(1)
         time.sleep(0.2)
         self.ii.highz_pin(1)
+        # the falling edge has already moved the LEDs on, so give a count on the rising edge time to show
         time.sleep(0.1)
         leds_after = self.ii.read_port(0)
         idx_after = self.get_index(leds_after)
@@ -239,7 +226,7 @@ class Prac9Tests(PracTests):
             self.ii.write_dac(1, dac1)
             expected = min(dac0, dac1)
             self.logger.info("Wrote {d0:#x} to POT0 and {d1:#x} to POT1.".format(d0 = dac0, d1 = dac1))
-            time.sleep(0.1)
+            self.wait_until(self.leds_in_range(expected-10, expected+5), 0.1)
             leds = self.ii.read_port(0)
             self.logger.info("Expected: {e:#x}, found: {f:#x}".format(e = expected, f = leds))
             if (leds > expected+5) or (leds < expected-10):
@@ -248,7 +235,7 @@ class Prac9Tests(PracTests):
         self.logger.info("All correct")
         self.submitter.increment_mark(1)
         self.ii.highz_pin(2)
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(leds_before), 0.1)
         leds_after = self.ii.read_port(0)
         self.logger.info("After releasing SW2, LEDs returned to: {l:#x}".format(l = leds_after))
         if leds_before == leds_after:
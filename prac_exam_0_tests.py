@@ -21,44 +21,34 @@ class PracExam0Tests(PracTests):
             self.submitter.sfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            escaped_dir = self.submitter.submission_directory.replace("'", "\\'")
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = escaped_dir, f = f)
-            self.exec_as_marker(cmd)
-        all_files = os.listdir()
+        os.chdir(self.workspace)
+        # the workspace is emptied first, so what's in it afterwards is exactly the files copied
+        all_files = [os.path.basename(f) for f in self.submitter.files_to_mark]
         s_files = [fi for fi in all_files if fi.endswith(".s")]
         self.logger.info("Found {n} .s files.".format(n = len(s_files)))
-        for s_file in s_files:
-            cmd = "sed -i \"s/.word 0xCA71D738/.word 0xCCEE2244/g\" {f}".format(f = s_file)
-            self.exec_as_marker(cmd)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+            for s_file in s_files:
+                cmd = "sed -i \"s/.word 0xCA71D738/.word 0xCCEE2244/g\" {f}".format(f = s_file)
+                self.exec_as_marker(cmd)
         self.logger.info("Your source file has been modified to replace .word 0xCA71D7398 with .word 0xCCEE2244")
         self.logger.info("The highest byte in the block is now 0xEE")
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        self.make("make")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.load()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
+            batch.write_dac(1, 0)
         try:
             self.logger.info("----------- PART 1 ----------------")
             self.part_1_tests()
@@ -83,8 +73,8 @@ class PracExam0Tests(PracTests):
         self.gdb.run_to_label('copy_to_RAM_complete')
         data = [0xA5588A12, 0x67BA553D, 0xCDEF2345, 0x35CDEC45]
         base_addr = 0x20000000
-        for idx, word in enumerate(data):
-            found = self.gdb.read_word(base_addr + (4*idx))
+        all_found = self.gdb.read_block(base_addr, len(data))
+        for idx, found in enumerate(all_found):
             self.logger.info("At RAM offset {offset}, expected {expected:#x}, found {found:#x}".format(
                 offset = idx, expected = data[idx], found = found))
             if found != data[idx]:
@@ -155,25 +145,15 @@ class PracExam0Tests(PracTests):
             return
 
     def part_4_tests(self):
-        t0 = time.time()
         self.logger.info("Trying to find transition from 0xF8 to another value.")
         self.logger.info("Waiting a maximum of 20 seconds for 0xF8")
-        while(True):
-            time.sleep(0.1)
-            if (self.ii.read_port(0) == 0xF8):
-                break
-            if (time.time() - t0 > 20):
-                self.logger.critical("Could not find 0xF8 in 20 seconds. Aborting")
-                return
+        if not self.wait_until(self.leds_equal(0xF8), 20):
+            self.logger.critical("Could not find 0xF8 in 20 seconds. Aborting")
+            return
         self.logger.info("Got 0xF8. Checking what's next")
-        t0 = time.time()
-        while(True):
-            time.sleep(0.1)
-            if (self.ii.read_port(0) != 0xF8):
-                break
-            if (time.time() - t0 > 5):
-                self.logger.critical("Got stuck on 0xF8 for more than 5 seconds. Aborting")
-                return
+        if not self.wait_until(self.leds_changed(0xF8), 5):
+            self.logger.critical("Got stuck on 0xF8 for more than 5 seconds. Aborting")
+            return
         leds = self.ii.read_port(0)
         self.logger.info("After 0xF8, LEDs went to: {leds:#x}".format(leds = leds))
         if leds in [0xF4, 0xEF]:
@@ -215,21 +195,21 @@ class PracExam0Tests(PracTests):
         self.ii.clear_pin(2)
         self.logger.info("Before holding SW2, LEDs showing: {leds:#x}".format(leds = leds_backup))
         self.ii.write_dac(1, 0x40)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0x37, 0x48), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For input of 0x40, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0x48) or (leds < 0x37):
             self.logger.critical("Wrong.")
             return
         self.ii.write_dac(1, 0x78)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0x70, 0x80), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For input of 0x78, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0x80) or (leds < 0x70):
             self.logger.critical("Wrong.")
             return
         self.ii.write_dac(1, 0xCC)
-        time.sleep(0.1)
+        self.wait_until(self.leds_in_range(0xC4, 0xD5), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("For input of 0xCC, LEDs showed: {leds:#x}".format(leds = leds))
         if (leds > 0xD5) or (leds < 0xC4):
@@ -237,7 +217,7 @@ class PracExam0Tests(PracTests):
             return
         self.logger.info("Good, now checking that LEDs restore when SW2 released")
         self.ii.highz_pin(2)
-        time.sleep(0.05)
+        self.wait_until(self.leds_equal(leds_backup), 0.05)
         leds_new = self.ii.read_port(0)
         self.logger.info("Backed up LEDs: {old:#x}. Restored LEDs: {new:#x}".format(old = leds_backup, new = leds_new))
         if (leds_backup != leds_new):
@@ -28,33 +28,23 @@ class PracExam1Part1Tests(PracTests):
             self.submitter.headerfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make -B")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+        self.make("make -B")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -75,7 +65,7 @@ class PracExam1Part1Tests(PracTests):
 
     def part_1_tests(self):
         self.gdb.send_continue()
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0x0A), 0.1)
         leds_before = self.ii.read_port(0)
         self.logger.info("Leds should show 0x0A, found to show: {l:#x}".format(l = leds_before))
         if leds_before == 0x0A:
@@ -89,6 +79,7 @@ class PracExam1Part1Tests(PracTests):
             self.ii.highz_pin(0)
             time.sleep(0.2)
         self.logger.info("LEDs should show {before:#x} + 10 = {expected:#x}".format(before = leds_before, expected = leds_before + 10))
+        # the tenth press has already been counted, so give any extra counts from bounces time to show
         time.sleep(0.2)
         leds_after = self.ii.read_port(0)
         self.logger.info("LEDs found to show {l:#x}".format(l = leds_after))
@@ -28,39 +28,29 @@ class PracExam1Part2Tests(PracTests):
             self.submitter.headerfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        for f in self.submitter.sourcefiles:
-            cmd = "sed -i \"s/0x42, 0x69, 0x12, 0xCC, 0xBB, 0x55, 0xA1, 0x33, 0x1A, 0xDF, 0x56/0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xD7, 0xBB, 0xA1/g\" {f}".format(f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Replaced array with:")
-        self.logger.info("0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xD7, 0xBB, 0xA1")
-        self.logger.info("Largest value should be 0xD7 and smallest should be 0xA1")
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make -B")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+            for f in self.submitter.sourcefiles:
+                cmd = "sed -i \"s/0x42, 0x69, 0x12, 0xCC, 0xBB, 0x55, 0xA1, 0x33, 0x1A, 0xDF, 0x56/0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xD7, 0xBB, 0xA1/g\" {f}".format(f = f)
+                self.exec_as_marker(cmd)
+            self.logger.info("Replaced array with:")
+            self.logger.info("0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xBB, 0xD7, 0xBB, 0xA1")
+            self.logger.info("Largest value should be 0xD7 and smallest should be 0xA1")
+        self.make("make -B")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -82,7 +72,7 @@ class PracExam1Part2Tests(PracTests):
     def part_2_tests(self):
         self.gdb.send_continue()
         self.logger.info("Not holding SW0, LEDs should show 0xD7")
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0xD7), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("LEDs displaying: {l:#x}".format(l = leds))
         if leds == 0xD7:
@@ -92,7 +82,7 @@ class PracExam1Part2Tests(PracTests):
             self.logger.critical("Incorrect")
         self.logger.info("Holding SW0, LEDs should show 0xA1")
         self.ii.clear_pin(0)
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0xA1), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("LEDs displaying: {l:#x}".format(l = leds))
         if leds == 0xA1:
@@ -28,37 +28,25 @@ class PracExam1Part3Tests(PracTests):
             self.submitter.headerfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            src = "{d}/{f}".format(d = self.submitter.submission_directory, f = f)
-            src = src.replace("'", "'\\''")
-            cmd = "cp \"{src}\" /home/marker/".format(src = src, f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make -B")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+        self.make("make -B")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
-        self.ii.write_dac(0, 0)
-        self.ii.write_dac(1, 0x10)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
+            batch.write_dac(0, 0)
+            batch.write_dac(1, 0x10)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -117,21 +105,19 @@ class PracExam1Part3Tests(PracTests):
         self.submitter.increment_mark(0.5)
         self.logger.info("Now checking timing")
         to_test = [(0x20, 0x20), (0xB0, 0xB0), (0x50, 0x90), (0xBA, 0x20), (0x10, 0x40)]
-        for dac0, dac1 in to_test:
-            self.ii.write_dac(0, dac0)
-            self.ii.write_dac(1, dac1)
-            larger_dac = max(dac0, dac1)
-            expected = round(0.3 + ((larger_dac/0xFF) * (2.5 - 0.3)), 2)
-            self.logger.info("Wrote {d0:.2} V to POT0 and {d1:.2} V to POT1.".format(d0 = 3.3*dac0/0xFF, d1 = 3.3*dac1/0xFF))
-            self.logger.info("Expected timing of 0.3 + ({v:.2}V/3.3 V)*(2.5-0.3) = {e} s".format(v = 3.3*larger_dac/0xFF, e = expected))
-            time.sleep(0.1)
-            leds = self.ii.read_port(0)
-            try:
-                self.logger.info("Looking for transition: {a:#x} -> {b:#x}".format(a = leds+1, b = leds+2))
-                timing = round(self.ii.timing_transition(leds+1, leds+2), 2)
-                self.logger.info("Found timing of: {t} seconds".format(t = timing))
-                if (timing > expected-0.13 and timing < expected+0.13):
-                    self.logger.info("Correct.")
-                    self.submitter.increment_mark(0.5)
-            except interrogator_interface.LEDTimingTimeout as e:
-                self.logger.critical("Could not find incrementing transition")
+        self.logger.info("Expected timing is 0.3 + (larger of the pot voltages/3.3 V)*(2.5-0.3) s")
+        results = self.dac_timing_sweep(to_test, lambda dac0, dac1: round(0.3 + ((max(dac0, dac1)/0xFF) * (2.5 - 0.3)), 2),
+                self.time_incrementing_transition)
+        for timing, expected in zip(results['measured'].round(2), results['expected']):
+            if (timing > expected-0.13 and timing < expected+0.13):
+                self.logger.info("{t:.2f} seconds is correct.".format(t = timing))
+                self.submitter.increment_mark(0.5)
+            else:
+                self.logger.critical("{t:.2f} seconds is incorrect. Expected {e} seconds".format(t = timing, e = expected))
+
+    def time_incrementing_transition(self):
+        # times a step of the count, so a display which isn't counting up by 1 gets no timing marks
+        time.sleep(0.1) # for the pots to take effect
+        leds = self.ii.read_port(0)
+        self.logger.info("Looking for transition: {a:#x} -> {b:#x}".format(a = leds+1, b = leds+2))
+        return self.ii.timing_transition(leds+1, leds+2)
@@ -29,35 +29,23 @@ class PracExam1Part4Tests(PracTests):
             self.submitter.headerfiles
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            src = "{d}/{f}".format(d = self.submitter.submission_directory, f = f)
-            src = src.replace("'", "'\\''")
-            cmd = "cp \"{src}\" /home/marker/".format(src = src, f = f)
-            self.exec_as_marker(cmd)
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make -B")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
-        elf_files = [fi for fi in all_files if fi.endswith(".elf")]
-        if len(elf_files) != 1:
-            self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
-            raise BuildFailedError
-        self.elf_file = elf_files[0]
+        os.chdir(self.workspace)
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+        self.make("make -B")
 
     def run_specific_prac_tests(self):
         self.gdb.open_file(self.elf_file)
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -84,7 +72,7 @@ class PracExam1Part4Tests(PracTests):
             voltage_out = ((idx+0.5)/9) * 3.3
             self.ii.write_dac(0, dac_out)
             self.logger.info("Setting POT0 to {v:.2} V".format(v = voltage_out))
-            time.sleep(0.1)
+            self.wait_until(self.leds_equal(pattern), 0.1)
             self.logger.info("Expected pattern {p:#x}".format(p = pattern))
             leds = self.ii.read_port(0)
             self.logger.info("Got pattern {p:#x}".format(p = leds))
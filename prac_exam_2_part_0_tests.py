@@ -26,10 +26,11 @@ class PracExam2Part0Tests(PracTests):
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -52,7 +53,7 @@ class PracExam2Part0Tests(PracTests):
         self.gdb.send_continue()
         self.ii.highz_pin(3)
         self.logger.info("Releasing SW3")
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0x42), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("Leds should show 0x42, found to show: {l:#x}".format(l = leds))
         if leds == 0x42:
@@ -61,7 +62,7 @@ class PracExam2Part0Tests(PracTests):
             self.logger.info("Incorrect")
         self.ii.clear_pin(3)
         self.logger.info("Holding SW3")
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0x69), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("Leds should show 0x69, found to show: {l:#x}".format(l = leds))
         if leds == 0x69:
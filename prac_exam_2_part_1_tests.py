@@ -27,10 +27,11 @@ class PracExam2Part1Tests(PracTests):
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -59,7 +60,7 @@ class PracExam2Part1Tests(PracTests):
             expected = larger
             self.logger.info("Wrote {d0:#x} to POT0 and {d1:#x} to POT1".format(d0 = dac0, d1 = dac1))
             self.logger.info("LEDs expected to show: {larger:#x}".format(larger = larger))
-            time.sleep(0.1)
+            self.wait_until(self.leds_in_range(expected*0.95 - 5, expected*1.05 + 2), 0.1)
             leds = self.ii.read_port(0)
             self.logger.info("LEDs found to show: {leds:#x}".format(leds = leds))
             if (leds > ((expected*0.95) - 5)) and (leds < ((expected*1.05) + 2)):
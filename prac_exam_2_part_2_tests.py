@@ -34,10 +34,11 @@ class PracExam2Part2Tests(PracTests):
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -58,7 +59,7 @@ class PracExam2Part2Tests(PracTests):
 
     def part_2_tests(self):
         self.gdb.send_continue()
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0x42), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("LEDs found to show: {l:#x}".format(l = leds))
         if leds == 0x42:
@@ -87,7 +88,7 @@ class PracExam2Part2Tests(PracTests):
         except gdb_interface.CodeVerifyFailed as e:
             return
         self.gdb.send_continue()
-        time.sleep(0.1)
+        self.wait_until(self.leds_equal(0x07), 0.1)
         leds = self.ii.read_port(0)
         self.logger.info("LEDs found to show: {l:#x}".format(l = leds))
         if leds == 0x07:
@@ -3,9 +3,20 @@ import time, os
 import subprocess
 from prac_tests import PracTests, TestFailedError, BuildFailedError, SourceFileProblem
 import interrogator_interface
+from interrogator_interface import CLEAR, HIGHZ
 import gdb_interface
 import zipfile
 
+# a press and release of SW1, long enough to get past any debouncing
+CLEAN_PULSE = [(1, CLEAR, 300000), (1, HIGHZ, 300000)]
+# SW1 bouncing for a few ms on both the falling and rising edge
+NOISY_PULSE = [(1, CLEAR, 1000), (1, HIGHZ, 1000),
+               (1, CLEAR, 1000), (1, HIGHZ, 1000),
+               (1, CLEAR, 500000),
+               (1, HIGHZ, 1000), (1, CLEAR, 1000),
+               (1, HIGHZ, 1000), (1, CLEAR, 1000),
+               (1, HIGHZ, 500000)]
+
 class PracExam2Part4Tests(PracTests):
 
     def catalogue_submission_files(self):
@@ -34,10 +45,11 @@ class PracExam2Part4Tests(PracTests):
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -82,10 +94,7 @@ class PracExam2Part4Tests(PracTests):
         leds_before = self.ii.read_port(0)
         idx_before = self.get_idx(leds_before)
         self.logger.info("Asserting a single, clean pulse on SW1. LEDs should go to next index")
-        self.ii.clear_pin(1)
-        time.sleep(0.3)
-        self.ii.highz_pin(1)
-        time.sleep(0.3)
+        self.ii.run_stimulus(CLEAN_PULSE)
         leds_after = self.ii.read_port(0)
         idx_after = self.get_idx(leds_after)
         self.logger.info("After clean pulse, LEDs showing {l:#x} with index {i}".format(l = leds_after, i = idx_after))
@@ -98,8 +107,7 @@ class PracExam2Part4Tests(PracTests):
         leds_before = leds_after
         idx_before = idx_after
         self.logger.info("Now checking it's the right edge. Asserting a clean falling edge. Should increment")
-        self.ii.clear_pin(1)
-        time.sleep(0.3)
+        self.ii.run_stimulus([(1, CLEAR, 300000)])
         leds_after = self.ii.read_port(0)
         idx_after = self.get_idx(leds_after)
         self.logger.info("After clean falling edge, LEDs showing: {l:#x} with index: {i}".format(l = leds_after, i = idx_after))
@@ -109,8 +117,7 @@ class PracExam2Part4Tests(PracTests):
             self.logger.info("Correct. Now checking nothing happens when a clean rising edge is occurs")
             leds_before = leds_after
             idx_before = idx_after
-            self.ii.highz_pin(1)
-            time.sleep(0.3)
+            self.ii.run_stimulus([(1, HIGHZ, 300000)])
             leds_after = self.ii.read_port(0)
             idx_after = self.get_idx(leds_after)
             self.logger.info("After clean rising edge, LEDs showing: {l:#x} with index: {i}".format(l = leds_after, i = idx_after))
@@ -123,18 +130,7 @@ class PracExam2Part4Tests(PracTests):
         self.logger.info("Asserting a noisy falling and noisy rising edge. LEDs should only change once")
         leds_before = self.ii.read_port(0)
         idx_before = self.get_idx(leds_before)
-        self.ii.clear_pin(1)
-        self.ii.highz_pin(1)
-        self.ii.clear_pin(1)
-        self.ii.highz_pin(1)
-        self.ii.clear_pin(1)
-        time.sleep(0.5)
-        self.ii.highz_pin(1)
-        self.ii.clear_pin(1)
-        self.ii.highz_pin(1)
-        self.ii.clear_pin(1)
-        self.ii.highz_pin(1)
-        time.sleep(0.5)
+        self.ii.run_stimulus(NOISY_PULSE)
         leds_after = self.ii.read_port(0)
         idx_after = self.get_idx(leds_after)
         self.logger.info("After noisy press, LEDs showing: {l:#x} with index: {i}".format(l = leds_after, i = idx_after))
@@ -146,10 +142,7 @@ class PracExam2Part4Tests(PracTests):
             self.logger.error("Incorrect")
         self.logger.info("Now checking for wrapping. Pressing button until last element is shown")
         for _ in range(10):
-            self.ii.clear_pin(1)
-            time.sleep(0.3)
-            self.ii.highz_pin(1)
-            time.sleep(0.3)
+            self.ii.run_stimulus(CLEAN_PULSE)
             if self.ii.read_port(0) == self.patterns[-1]:
                 break
         leds = self.ii.read_port(0)
@@ -157,10 +150,7 @@ class PracExam2Part4Tests(PracTests):
             self.logger.error("Could not find last pattern")
             return
         self.logger.info("LEDs showing last pattern. Doing one clean press to check it goes to pattern 0")
-        self.ii.clear_pin(1)
-        time.sleep(0.3)
-        self.ii.highz_pin(1)
-        time.sleep(0.3)
+        self.ii.run_stimulus(CLEAN_PULSE)
         leds = self.ii.read_port(0)
         idx = self.get_idx(leds)
         self.logger.info("LEDs displaying {l:#x} with index {i}".format(l = leds, i = idx))
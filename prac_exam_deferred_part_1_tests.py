@@ -25,10 +25,11 @@ class PracExam2Part0Tests(PracTests):
         self.gdb.connect()
         self.gdb.erase()
         self.gdb.soft_reset()
-        self.ii.highz_pin(0)
-        self.ii.highz_pin(1)
-        self.ii.highz_pin(2)
-        self.ii.highz_pin(3)
+        with self.ii.batch() as batch:
+            batch.highz_pin(0)
+            batch.highz_pin(1)
+            batch.highz_pin(2)
+            batch.highz_pin(3)
         try:
             self.gdb.load()
         except gdb_interface.CodeLoadFailed as e:
@@ -51,10 +52,11 @@ class PracExam2Part0Tests(PracTests):
         self.gdb.send_continue()
         patterns = [12, 7, 15, 1, 9, 0]
         for pattern in patterns:
-            self.ii.highz_pin(0)
-            self.ii.highz_pin(1)
-            self.ii.highz_pin(2)
-            self.ii.highz_pin(3)
+            with self.ii.batch() as batch:
+                batch.highz_pin(0)
+                batch.highz_pin(1)
+                batch.highz_pin(2)
+                batch.highz_pin(3)
             sw0 = True if pattern & 0b0001 != 0 else False
             sw1 = True if pattern & 0b0010 != 0 else False
             sw2 = True if pattern & 0b0100 != 0 else False
@@ -70,7 +72,7 @@ class PracExam2Part0Tests(PracTests):
             self.logger.info("Pushing the following: SW0: {0}, SW1: {1}, SW2: {2}, SW3: {3}".format(
                 sw0, sw1, sw2, sw3))
             self.logger.info("Expecting value: {v}".format(v = pattern))
-            time.sleep(0.1)
+            self.wait_until(self.leds_equal(pattern), 0.1)
             leds = self.ii.read_port(0)
             self.logger.info("Got value: {v}".format(v = leds))
             if leds == pattern:
@@ -1,11 +1,15 @@
 import time
-from openocd import OpenOCD
+from openocd import OpenOCDSession
 from gdb_interface import GDBInterface
-from interrogator_interface import InterrogatorInterface
-import subprocess
+from interrogator_interface import InterrogatorInterface, LEDTimingTimeout
+from rig import DEFAULT_RIG
+from budget import Budget, BudgetExhausted
+import build_cache
+import marker_worker
 import shlex
 import os
 import zipfile
+import numpy as np
 
 class PracFailedError(Exception):
     pass
@@ -15,68 +19,256 @@ class BuildFailedError(PracFailedError):
     pass
 class SourceFileProblem(PracFailedError):
     pass
+# the rig, rather than the submission, is at fault, so the submitter should be tested on another rig
+class RigFailedError(Exception):
+    pass
+
+class MarkerJob:
+    """ Collects what exec_as_marker and copy_as_marker are asked to do inside the with block and
+    has the marker worker do it all in one go when the block ends. Get one from PracTests.marker_job().
+    A step which fails raises BuildFailedError then, and the steps after it aren't run.
+    """
+    def __init__(self, tests):
+        self.tests = tests
+        self.steps = []
+
+    def __enter__(self):
+        self.tests.current_job = self
+        return self
+    def __exit__(self, type, value, traceback):
+        self.tests.current_job = None
+        if type is None:
+            self.tests.run_marker_steps(self.steps)
 
 class PracTests:
-    def __init__(self, submitter, logger):
+    # wall-clock seconds a submitter's tests may take on the rig before marking is cut short
+    TIME_BUDGET = 300
+    # where build_cache keeps the .elf files of earlier builds. None builds everything afresh
+    BUILD_CACHE_DIR = "/tmp/automarker_build_cache/"
+
+    def __init__(self, submitter, logger, rig = DEFAULT_RIG):
         self.logger = logger
         self.submitter = submitter
+        self.rig = rig
+        self.workspace = rig.workspace
+        self.budget = None
+        self.current_job = None
 
     def prebuild(self):
         self.logger.debug("No prebuild routine done")
         pass
 
     def build(self):
-        self.clean_marker_directory()
-        os.chdir('/home/marker/')
-        for f in self.submitter.files_to_mark:
-            cmd = "cp \"{d}/{f}\" /home/marker/".format(d = self.submitter.submission_directory, f = f)
-            self.exec_as_marker(cmd)
-        self.prebuild()
-        self.logger.info("Running 'make' in submission directory")
-        try:
-            self.exec_as_marker("make -B")
-        except BuildFailedError as e:
-            self.logger.info("Received build error. Aborting")
-            raise BuildFailedError
-        all_files = os.listdir()
+        os.chdir(self.workspace)
+        # cleaning, copying and patching go to the marker worker as one job
+        with self.marker_job():
+            self.clean_marker_directory()
+            for f in self.submitter.files_to_mark:
+                self.copy_as_marker(os.path.join(self.submitter.submission_directory, f))
+            self.prebuild()
+        self.make("make -B")
+
+    def make(self, cmd):
+        """ Builds the files copied (and patched) into the workspace by running cmd there, and finds
+        the .elf it makes. If the same files were built before with the same command and toolchain,
+        the .elf from then is restored and cmd isn't run at all.
+        """
+        key = build_cache.build_key(self.workspace, cmd) if self.BUILD_CACHE_DIR is not None else None
+        cached_elf = build_cache.lookup(self.BUILD_CACHE_DIR, key) if key is not None else None
+        if cached_elf is not None:
+            self.logger.info("These files have been built before, so using the .elf from then")
+            self.copy_as_marker(cached_elf)
+        else:
+            self.logger.info("Running '{c}' in submission directory".format(c = cmd))
+            try:
+                self.exec_as_marker(cmd)
+            except BuildFailedError as e:
+                self.logger.info("Received build error. Aborting")
+                raise BuildFailedError
+        all_files = os.listdir(self.workspace)
         elf_files = [fi for fi in all_files if fi.endswith(".elf")]
         if len(elf_files) != 1:
             self.logger.critical("Too few or too many elf files found after make. Directory contents: {af}".format(af = all_files))
             raise BuildFailedError
         self.elf_file = elf_files[0]
+        if key is not None and cached_elf is None:
+            build_cache.store(self.BUILD_CACHE_DIR, key, os.path.join(self.workspace, self.elf_file))
 
     def run_tests(self):
-        self.ii = InterrogatorInterface()
-        self.ii.reset(0) # pull NRST low
-        time.sleep(1)
-        with OpenOCD(self.logger.getChild('openocd')) as openocd:
-            self.ii.reset(1) # release NRST to allow openocd to connect
-            time.sleep(0.5)
-            with GDBInterface(self.logger.getChild('gdb')) as self.gdb:
-                # must be implemented in subclass
-                self.run_specific_prac_tests()
+        # the build may have happened in another process, so get back to the build products
+        os.chdir(self.workspace)
+        try:
+            self.prepare_rig()
+        except Exception as e:
+            raise RigFailedError("{r} could not be made ready for testing".format(r = self.rig.name)) from e
+        # started only now, so time spent getting the rig ready isn't charged to the submitter
+        budget = Budget(self.TIME_BUDGET)
+        self.budget = self.ii.budget = self.gdb.budget = budget
+        self.submitter.budget_exhausted = False
+        try:
+            # must be implemented in subclass
+            self.run_specific_prac_tests()
+        except BudgetExhausted:
+            pass # the tests may also have caught it, so it is reported below either way
+        finally:
+            self.ii.stop_polling() # in case the tests started the LED poller
+            # the GDB and interrogator sessions outlive this submitter, as may this object
+            self.budget = self.ii.budget = self.gdb.budget = None
+        if budget.exhausted():
+            self.submitter.budget_exhausted = True
+            self.logger.critical("Testing took longer than the {s} seconds allowed. Marking stopped there".format(s = self.TIME_BUDGET))
         self.logger.info("Final mark: {m:g}".format(m = self.submitter.mark))
 
-    def exec_as_marker(self, cmd):
-        full_cmd = "sudo -u marker HOME=/home/marker sh -c 'cd /home/marker/; " + cmd + "'"
+    def prepare_rig(self):
+        """ Gets the rig's interrogator, OpenOCD and GDB sessions ready for the next submitter
+        """
+        if self.rig.ii is None:
+            # opened once per rig rather than once per submitter
+            self.rig.ii = InterrogatorInterface(self.rig.interrogator_device)
+        else:
+            self.rig.ii.check_connection()
+        self.ii = self.rig.ii
+        if self.rig.openocd is None:
+            # started once and then shared by every submitter tested on this rig
+            self.rig.openocd = OpenOCDSession(self.logger.getChild('openocd'), self.rig)
+        openocd_restarted = self.rig.openocd.attach(self.ii)
+        if self.rig.gdb is not None and not self.rig.gdb.prepare_for_next_submitter(openocd_restarted):
+            self.rig.gdb.terminate()
+            self.rig.gdb = None
+        if self.rig.gdb is None:
+            # like OpenOCD, GDB is kept running between submitters and only respawned when wedged
+            self.rig.gdb = GDBInterface(self.logger.getChild('gdb'), self.rig)
+        self.gdb = self.rig.gdb
+
+    def log_led_activity(self, window):
+        """ For diagnostics when an expected pattern wasn't found: one capture of everything the LEDs showed
+        """
+        edges = self.ii.capture_port(window)
+        self.logger.info("Over {w:g} seconds, LEDs displayed: {e}".format(w = window,
+            e = ", ".join("{p:#X} at {t:.2f} s".format(p = p, t = t) for t, p in edges)))
+
+    def wait_until(self, predicate, timeout, poll_interval = 0.01):
+        """ Instead of a fixed sleep: calls predicate every poll_interval seconds until it returns True
+        or timeout seconds have passed. Returns whether it became True.
+        """
+        if self.budget is not None:
+            timeout = self.budget.timeout(timeout)
+        t0 = time.time()
+        while not predicate():
+            if time.time() - t0 >= timeout:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    # ready made predicates for wait_until
+    def leds_equal(self, pattern):
+        return lambda: self.ii.read_port(0) == pattern
+
+    def leds_in_range(self, low, high):
+        return lambda: low <= self.ii.read_port(0) <= high
+
+    def leds_changed(self, from_pattern = None):
+        """ True once the LEDs show something other than from_pattern, by default what they show now
+        """
+        if from_pattern is None:
+            from_pattern = self.ii.read_port(0)
+        return lambda: self.ii.read_port(0) != from_pattern
+
+    def target_halted(self):
+        # asks OpenOCD rather than GDB, so as not to eat the prompt GDB prints when the target stops
+        return lambda: self.rig.openocd.openocd.target_state() == "halted"
+
+    def dac_timing_sweep(self, points, expected, measure = None):
+        """ Sets the pots to each of points in turn, a list of (dac0, dac1) values where None leaves
+        a channel as it is, and measures the LED timing at each. expected is the timing each point
+        should give, as a list or a function of (dac0, dac1). By default the settled LED dwell time
+        is measured; measure can be a function which times a particular transition instead. Either way the
+        LEDs are first given time to settle at each point, so that a program which only reads the pots
+        once per cycle has shown at least one full cycle at the new setting before anything is timed.
+        Returns a NumPy record array with fields dac0, dac1, expected and measured, where measured
+        is NaN for points at which no timing could be found.
+        """
+        if callable(expected):
+            expected = [expected(dac0, dac1) for dac0, dac1 in points]
+        results = np.zeros(len(points), dtype = [('dac0', float), ('dac1', float), ('expected', float), ('measured', float)])
+        self.ii.start_polling() # left running between points rather than restarted for each settle check
+        for idx, ((dac0, dac1), expected_timing) in enumerate(zip(points, expected)):
+            with self.ii.batch() as batch:
+                if dac0 is not None:
+                    batch.write_dac(0, dac0)
+                if dac1 is not None:
+                    batch.write_dac(1, dac1)
+            self.logger.info("Set POT0 to {d0} and POT1 to {d1}. Timing should be {e:.2f} seconds".format(
+                d0 = "{:#x}".format(dac0) if dac0 is not None else "unchanged",
+                d1 = "{:#x}".format(dac1) if dac1 is not None else "unchanged",
+                e = expected_timing))
+            # long enough for the dwell in progress plus two full ones at the expected timing
+            timing = self.ii.wait_for_settle(timeout = 3*expected_timing + 0.5)
+            if measure is not None:
+                if timing is None:
+                    self.logger.warning("LED timing did not settle, timing the transition anyway")
+                try:
+                    timing = measure()
+                except LEDTimingTimeout:
+                    timing = None
+            if timing is None:
+                self.logger.critical("Could not measure LED timing")
+                self.log_led_activity(2*expected_timing)
+                timing = float('nan')
+            else:
+                self.logger.info("Found to be {t:.2f} seconds".format(t = timing))
+            results[idx] = (np.nan if dac0 is None else dac0, np.nan if dac1 is None else dac1, expected_timing, timing)
+        return results
+
+    def marker_job(self):
+        return MarkerJob(self)
+
+    def exec_as_marker(self, cmd, directory = None, timeout = 10):
+        if directory is None:
+            directory = self.workspace
+        if self.budget is not None:
+            timeout = self.budget.timeout(timeout)
+        full_cmd = "sh -c 'cd \"" + directory + "\"; " + cmd + "'"
         self.logger.debug("Exec as marker: {c}".format(c = full_cmd))
-        clean_full_cmd = shlex.split(full_cmd)
-        proc = subprocess.Popen(clean_full_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-        try:
-            return_code = proc.wait(10)
-        except subprocess.TimeoutExpired:
-            self.logger.critical("Process timed out. Killing it")
-            os.system("sudo -u marker killall -s SIGKILL -u marker")
-            raise BuildFailedError
-        if return_code != 0:
+        self.add_marker_step({'action': 'run', 'argv': shlex.split(full_cmd), 'timeout': timeout})
+
+    def copy_as_marker(self, source, destination = None):
+        if destination is None:
+            destination = self.workspace
+        self.logger.debug("Copy as marker: {s} to {d}".format(s = source, d = destination))
+        self.add_marker_step({'action': 'copy', 'source': source, 'destination': destination})
+
+    def add_marker_step(self, step):
+        if self.current_job is not None:
+            self.current_job.steps.append(step)
+        else:
+            self.run_marker_steps([step])
+
+    def run_marker_steps(self, steps):
+        reply = marker_worker.worker().run_job(steps)
+        if reply['ok']:
+            return
+        if reply['timed_out']:
+            # the worker killed the step's whole process group, and nothing else
+            self.logger.critical("Process timed out. Killed it")
+        else:
             self.logger.critical("Non-zero return code received")
-            error_message = proc.communicate()
-            self.logger.critical(error_message[0].decode())
-            self.logger.critical(error_message[1].decode())
-            raise BuildFailedError
+            self.logger.critical(reply['stdout'])
+            self.logger.critical(reply['stderr'])
+        raise BuildFailedError
 
     def clean_marker_directory(self):
-        self.exec_as_marker("rm -rf /home/marker/*")
+        self.exec_as_marker("rm -rf \"{w}\"/*".format(w = self.workspace))
+
+    def create_workspace(self, workspace):
+        """ Switches to a private build directory for this submitter, creating it if needed.
+        Used when several submitters are built at once and so cannot share the rig's workspace.
+        """
+        self.exec_as_marker("mkdir -p \"{w}\"".format(w = workspace), directory = "/home/marker/")
+        self.workspace = workspace
+
+    def remove_workspace(self):
+        self.exec_as_marker("rm -rf \"{w}\"".format(w = self.workspace), directory = "/home/marker/")
 
     def unzip_submission(self):
         os.chdir(self.submitter.submission_directory)
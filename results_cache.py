@@ -0,0 +1,77 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+
+# Marks and comments from earlier runs, so that re-running the automarker only tests the
+# submitters whose result could have changed. An entry is reused when its key matches, and the
+# key covers everything a mark depends on: the submitted files as built (after any patching),
+# the submitter's details which the tests read, the source of the test classes and the modules
+# they measure with, and the calibration of the rigs.
+
+# modules outside the tester classes whose code decides what the tests measure and how it is judged
+TEST_SUPPORT_MODULES = ("interrogator_interface", "trace_analysis", "gdb_interface", "openocd", "elf_parser", "budget")
+# attributes of the submitter, besides its files, which tester classes read when marking (e.g. to
+# adjust the mark of a late submission)
+SUBMITTER_METADATA = ("submission_time",)
+
+def hash_files(directory, files):
+    h = hashlib.sha256()
+    for f in sorted(files):
+        h.update(f.encode() + b'\0')
+        path = os.path.join(directory, f)
+        if os.path.isfile(path):
+            with open(path, 'rb') as fi:
+                h.update(hashlib.sha256(fi.read()).digest())
+        else:
+            h.update(b'missing')
+    return h.hexdigest()
+
+def hash_test_sources(tester_class):
+    """ Hashes the source files of tester_class, the classes it inherits from and TEST_SUPPORT_MODULES
+    """
+    h = hashlib.sha256()
+    paths = set(inspect.getsourcefile(c) for c in tester_class.__mro__ if c is not object)
+    paths.update(inspect.getsourcefile(importlib.import_module(m)) for m in TEST_SUPPORT_MODULES)
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            h.update(os.path.basename(path).encode() + b'\0' + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def hash_submitter_metadata(submitter):
+    """ Hashes the SUBMITTER_METADATA attributes of submitter, any it hasn't got counting as None
+    """
+    h = hashlib.sha256()
+    for name in SUBMITTER_METADATA:
+        h.update(name.encode() + b'\0' + repr(getattr(submitter, name, None)).encode() + b'\0')
+    return h.hexdigest()
+
+def results_key(submission_hash, metadata_hash, tests_hash, calibration):
+    return hashlib.sha256("{s}:{m}:{t}:{c}".format(s = submission_hash, m = metadata_hash, t = tests_hash,
+            c = calibration).encode()).hexdigest()
+
+class ResultsCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {} # user_id -> {'key': ..., 'mark': ..., 'comments': ...}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def lookup(self, user_id, key):
+        entry = self.entries.get(user_id)
+        if entry is None or entry['key'] != key:
+            return None
+        return entry
+
+    def record(self, user_id, key, mark, comments):
+        self.entries[user_id] = {'key': key, 'mark': mark, 'comments': comments}
+        self.save()
+
+    def save(self):
+        # written to the side and renamed, so a crash can't leave a half written cache
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,38 @@
+class Rig:
+    """ Describes one marking rig: an interrogator board, the ST-Link attached
+    to the target and the OpenOCD ports used to talk to it, plus the directory
+    in which submissions are built for that rig.
+    Connections that are kept open between submitters hang off the rig and are
+    released by close().
+    """
+    def __init__(self, name, interrogator_device, stlink_serial = None,
+                 gdb_port = 3333, tcl_port = 6666, telnet_port = 4444,
+                 workspace = "/home/marker/"):
+        self.name = name
+        self.interrogator_device = interrogator_device
+        self.stlink_serial = stlink_serial
+        self.gdb_port = gdb_port
+        self.tcl_port = tcl_port
+        self.telnet_port = telnet_port
+        self.workspace = workspace
+        self.ii = None
+        self.openocd = None
+        self.gdb = None
+
+    def close(self):
+        if self.gdb is not None:
+            self.gdb.terminate()
+            self.gdb = None
+        if self.openocd is not None:
+            self.openocd.close()
+            self.openocd = None
+        if self.ii is not None:
+            self.ii.close()
+            self.ii = None
+
+    def __repr__(self):
+        return "Rig({n}: {d}, stlink {s}, gdb port {p})".format(
+            n = self.name, d = self.interrogator_device, s = self.stlink_serial, p = self.gdb_port)
+
+# The single rig that was hard-coded before rig pools existed
+DEFAULT_RIG = Rig("rig0", "/dev/ttyUSB0")
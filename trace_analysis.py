@@ -0,0 +1,94 @@
+import numpy as np
+
+# Analysis of LED timelines, as returned by InterrogatorInterface.capture_port().
+# A trace is a sequence of (time, pattern) pairs, or an (N, 2) array of them. Repeated
+# patterns, as from polling, are collapsed so only the changes are looked at.
+# The first pattern in a trace may have been showing for a while before the trace started
+# and the last may carry on after it ended, so neither counts as a complete dwell.
+
+def edges(trace):
+    """ Returns (times, patterns) arrays holding only the points where the pattern changed
+    """
+    trace = np.asarray(trace, dtype=float).reshape(-1, 2)
+    times = trace[:, 0]
+    patterns = trace[:, 1].astype(np.int64) & 0xFF
+    changed = np.ones(len(patterns), dtype=bool)
+    changed[1:] = patterns[1:] != patterns[:-1]
+    return times[changed], patterns[changed]
+
+def segments(trace):
+    """ Returns (patterns, durations, previous) for each complete dwell: the pattern shown,
+    how long it was shown for and the pattern shown before it.
+    """
+    times, patterns = edges(trace)
+    if len(patterns) < 3:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0), empty
+    return patterns[1:-1], np.diff(times)[1:], patterns[:-2]
+
+def dwell_times(trace):
+    """ Returns a dict of pattern -> array of how long each complete showing of it lasted
+    """
+    patterns, durations, previous = segments(trace)
+    return {int(p): durations[patterns == p] for p in np.unique(patterns)}
+
+def transition_timings(trace, pattern0, pattern1):
+    """ How long pattern1 stayed on the LEDs after each pattern0 -> pattern1 transition.
+    The same measurement as InterrogatorInterface.timing_transition, for every occurrence at once.
+    """
+    patterns, durations, previous = segments(trace)
+    return durations[(previous == (pattern0 & 0xFF)) & (patterns == (pattern1 & 0xFF))]
+
+def transition_matrix(trace, patterns):
+    """ counts[i, j] is how often patterns[i] was followed by patterns[j].
+    The extra last row and column count transitions from and to patterns not in the list.
+    """
+    lookup = np.full(256, len(patterns), dtype=np.int64)
+    lookup[np.asarray(patterns, dtype=np.int64) & 0xFF] = np.arange(len(patterns))
+    times, seen = edges(trace)
+    idx = lookup[seen]
+    counts = np.zeros((len(patterns) + 1, len(patterns) + 1), dtype=np.int64)
+    np.add.at(counts, (idx[:-1], idx[1:]), 1)
+    return counts
+
+def sequence_errors(trace, sequence):
+    """ Counts the transitions which don't go to the next pattern of the (cyclic) sequence
+    """
+    sequence = np.asarray(sequence, dtype=np.int64) & 0xFF
+    following = np.full(256, -1, dtype=np.int64)
+    following[sequence] = np.roll(sequence, -1)
+    times, seen = edges(trace)
+    return int(np.count_nonzero(following[seen[:-1]] != seen[1:]))
+
+def bounce_count(trace, t0, t1):
+    """ Number of pattern changes after t0 and up to t1
+    """
+    times, seen = edges(trace)
+    return int(np.count_nonzero((times[1:] > t0) & (times[1:] <= t1)))
+
+def jitter_stats(durations):
+    durations = np.asarray(durations, dtype=float)
+    if len(durations) == 0:
+        return {'count': 0, 'min': None, 'mean': None, 'max': None, 'std': None}
+    return {'count': len(durations),
+            'min': float(durations.min()),
+            'mean': float(durations.mean()),
+            'max': float(durations.max()),
+            'std': float(durations.std())}
+
+def within_tolerance(measured, expected, tolerance = 0.05):
+    """ Element-wise check that measured is within tolerance (as a fraction) of expected, bounds included
+    """
+    measured = np.asarray(measured, dtype=float)
+    expected = np.asarray(expected, dtype=float)
+    # written as the tests always wrote it, so a reading on the boundary passes as it did there
+    return (measured >= expected*(1 - tolerance)) & (measured <= expected*(1 + tolerance))
+
+def analyse(trace, sequence):
+    """ Everything a test usually wants from a capture of a repeating sequence of patterns, in one pass
+    """
+    dwells = dwell_times(trace)
+    return {'dwell_times': dwells,
+            'jitter': {p: jitter_stats(d) for p, d in dwells.items()},
+            'transitions': transition_matrix(trace, sequence),
+            'sequence_errors': sequence_errors(trace, sequence)}